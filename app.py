@@ -1,187 +1,263 @@
-from flask import Flask, render_template, request, session, redirect, url_for, jsonify
-from flask_session import Session
-import traceback
-import os
+from flask import (Flask, render_template, request, session, redirect, url_for, jsonify, Response,
+                   make_response, stream_with_context, g)
+import hmac
+import json
+import time
+from datetime import datetime
 
 # Import our custom modules
-from utils.config import SESSION_DIR, debug_log, LOGS_DIR
+from utils.config import (SESSION_DIR, SESSION_BACKEND, GAME_CONFIG, ADMIN_TOKEN, SINGLE_PAGE_RUNNER,
+                          MAX_LOG_BATCH, LOGS_DIR, STATELESS_GAMES, SECRET_KEY, TASK_POOL_CONFIGS)
+from utils.AppLog import get_logger
+from utils.Diagnostics import Diagnostics
 from utils.GameLogger import GameLogger
-from utils.VSTtask import VSTtask
-
-import datetime
+from utils.GameToken import GameTokens
+from utils.LogExport import FORMATS, export_games, parse_filters
+from utils.Metrics import metrics, instrument_session_interface
+from utils.RenderCache import RenderCache, cached_response
+from utils.SessionStore import StoreSessionInterface, make_session_interface
+from utils.StaticAssets import StaticAssets
+from utils.StudyStats import study_stats
+from utils.TaskPool import TaskPool
+from utils.VSTtask import load_task
 
 app = Flask(__name__)
+logger = get_logger('app')
 
-# Configure filesystem session
+# Configure server-side session
 app.config.update(
     SESSION_TYPE='filesystem',
     SESSION_FILE_DIR=SESSION_DIR,
-    SECRET_KEY='your_secret_key_here',
+    SECRET_KEY=SECRET_KEY or 'your_secret_key_here',
     SESSION_PERMANENT=False,
     PERMANENT_SESSION_LIFETIME=1800  # 30 minutes
 )
 
-# Initialize Flask-Session
-Session(app)
+if STATELESS_GAMES and not SECRET_KEY:
+    raise RuntimeError("TRT_STATELESS_GAMES=1 requires TRT_SECRET_KEY: the game token is signed with it")
+if STATELESS_GAMES:
+    # Game state travels in a signed token; Flask's default cookie session needs no store either
+    game_tokens = GameTokens(app.secret_key, app.config['PERMANENT_SESSION_LIFETIME'])
+elif SESSION_BACKEND == 'filesystem':
+    # Initialize Flask-Session (imported only when it is the chosen backend)
+    from flask_session import Session
+    Session(app)
+else:
+    app.session_interface = make_session_interface(SESSION_BACKEND)
+instrument_session_interface(app.session_interface, metrics)
 
 # Initialize the game logger
 game_logger = GameLogger()
 
-# Add this function to your app.py
-def test_session_state():
-    """Test session functionality and return diagnostic info"""
-    test_results = {
-        "session_exists": False,
-        "session_dir_exists": False,
-        "session_dir_writable": False,
-        "session_file_details": None,
-        "current_session_data": None,
-        "game_log_details": None
+# Dashboard totals are kept up to date by the game logger; count stored games once if they never were
+try:
+    study_stats.seed(game_logger.storage)
+except Exception as e:
+    logger.exception("Could not seed study stats: %s", e)
+
+# Ready-made tasks for /start
+task_pool = TaskPool()
+
+# Pre-rendered pages, and versioned, precompressed static files
+render_cache = RenderCache()
+static_assets = StaticAssets(app)
+
+# Cached health probes behind /healthz and /diagnostics
+probe_dirs = {'game_logs': game_logger.storage.data_dir(), 'app_logs': LOGS_DIR}
+if not STATELESS_GAMES and SESSION_BACKEND != 'memory':
+    probe_dirs['sessions'] = SESSION_DIR
+diagnostics = Diagnostics(
+    probe_dirs, game_logger, task_pool=task_pool,
+    session_store=app.session_interface.store if isinstance(app.session_interface, StoreSessionInterface) else None)
+
+def warm_up():
+    """Compile every template and pre-render the cached pages before serving.
+
+    Run once in the gunicorn master with preload_app (see gunicorn.conf.py),
+    so forked workers start with it all in memory. Returns the seconds taken.
+    """
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    static_assets.warm()
+    with app.test_request_context('/'):
+        render_cache.page('index.html')
+        render_cache.page('round.html', runner=True)
+        for config in TASK_POOL_CONFIGS:
+            render_cache.page('final.html', n_quadrants=config['n_quadrants'])
+            n_cues = cues_per_round(config)
+            render_cache.skeleton('round.html', n_cues, round_context(n_cues))
+    elapsed = time.perf_counter() - start
+    logger.info("Warmed up templates, page cache and static assets in %.3fs", elapsed)
+    return elapsed
+
+def warm_worker():
+    """Per-process warm-up after a fork: fill this worker's task pool and start its health probe"""
+    start = time.perf_counter()
+    task_pool.fill()
+    diagnostics.start()
+    return time.perf_counter() - start
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Session save runs after this hook and is timed separately as a span
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe('trt_http_request_duration_seconds', time.perf_counter() - start, {'endpoint': endpoint})
+        metrics.inc('trt_http_requests_total', {'endpoint': endpoint, 'status': response.status_code})
+    return response
+
+def game_state():
+    """The current game's 'game_id', 'log_filepath' and 'game': from the signed token, or the session"""
+    if not STATELESS_GAMES:
+        return session
+    if 'game_state' not in g:
+        g.game_state = token_state(game_tokens.loads(request.cookies.get(GameTokens.COOKIE))) or {}
+    return g.game_state
+
+def token_state(state):
+    """A decoded game token with its log reference, which the token itself never carries"""
+    if state:
+        state['log_filepath'] = game_logger.game_ref(state['game_id'], state['start_time'])
+    return state
+
+def game_task(game):
+    """Rebuild the task for the game stored in the session"""
+    return load_task(game['seed'], game['n_rounds'], game['n_quadrants'], game['n_queues'])
+
+def cues_per_round(game):
+    """Cues on each round page (every queue of every quadrant), which is the round skeleton's layout"""
+    return game['n_quadrants'] * game['n_queues']
+
+def round_context(n_queues):
+    """Template context of a round page with n_queues cues; slot() supplies each per-round value"""
+    def build(slot):
+        return {
+            'round_number': slot('round_number'),
+            'round_label': slot('round_label'),
+            'next_round': slot('next_round'),
+            'game_id': slot('game_id'),
+            'round_data': {'queues': [
+                {'name': slot(f'name{i}'), 'color': slot(f'color{i}'), 'quadrant': slot(f'quadrant{i}')}
+                for i in range(n_queues)
+            ]},
+        }
+    return build
+
+def round_values(round_number, round_data, game_id):
+    values = {
+        'round_number': round_number,
+        'round_label': round_number + 1,
+        'next_round': round_number + 1,
+        'game_id': game_id or '',
     }
-    
-    # Test 1: Check if session exists and has data
-    test_results["session_exists"] = bool(session)
-    if session:
-        test_results["current_session_data"] = dict(session)
-        debug_log(f"Current session data: {dict(session)}")
-    
-    # Test 2: Check session directory
-    test_results["session_dir_exists"] = os.path.exists(SESSION_DIR)
-    if test_results["session_dir_exists"]:
-        try:
-            test_file = os.path.join(SESSION_DIR, "test_write")
-            with open(test_file, 'w') as f:
-                f.write("test")
-            os.remove(test_file)
-            test_results["session_dir_writable"] = True
-        except Exception as e:
-            debug_log(f"Session directory write test failed: {str(e)}")
-    
-    # Test 3: Check session files
-    if session.get('game_id'):
-        try:
-            session_files = [f for f in os.listdir(SESSION_DIR) if f.startswith('sess')]
-            test_results["session_file_details"] = {
-                "files_found": len(session_files),
-                "files": session_files
-            }
-        except Exception as e:
-            debug_log(f"Error listing session files: {str(e)}")
-        
-        # Test 4: Check game log file
-        log_filepath = session.get('log_filepath')
-        if log_filepath:
-            try:
-                test_results["game_log_details"] = {
-                    "exists": os.path.exists(log_filepath),
-                    "path": log_filepath,
-                    "permissions": oct(os.stat(log_filepath).st_mode)[-3:] if os.path.exists(log_filepath) else None,
-                    "directory_writable": os.access(os.path.dirname(log_filepath), os.W_OK)
-                }
-            except Exception as e:
-                debug_log(f"Error checking log file: {str(e)}")
-    
-    debug_log(f"Session test results: {test_results}")
-    return test_results
+    for i, cue in enumerate(round_data['queues']):
+        values.update({f'name{i}': cue['name'], f'color{i}': cue['color'], f'quadrant{i}': cue['quadrant']})
+    return values
 
+def admin_authorized():
+    """Check the admin token from an 'Authorization: Bearer' header or ?token="""
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    supplied = supplied or request.args.get('token', '')
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
 
 @app.route('/')
 def index():
-    debug_log("Accessing index page")
-    debug_log(f"Current session state: {dict(session)}")  # Add session logging
-    return render_template('index.html')
-
-@app.route('/test_session')
-def test_session():
-    """Test route to diagnose session issues"""
-    debug_log("Testing session functionality")
-    
-    # Test results dictionary
-    test_results = {
-        "session_exists": False,
-        "session_dir_exists": False,
-        "session_dir_writable": False,
-        "session_file_details": None,
-        "current_session_data": None,
-        "game_log_details": None
-    }
-    
-    # Test 1: Check if session exists and has data
-    test_results["session_exists"] = bool(session)
-    if session:
-        test_results["current_session_data"] = dict(session)
-        debug_log(f"Current session data: {dict(session)}")
-    
-    # Test 2: Check session directory
-    test_results["session_dir_exists"] = os.path.exists(SESSION_DIR)
-    if test_results["session_dir_exists"]:
-        try:
-            test_file = os.path.join(SESSION_DIR, "test_write")
-            with open(test_file, 'w') as f:
-                f.write("test")
-            os.remove(test_file)
-            test_results["session_dir_writable"] = True
-        except Exception as e:
-            debug_log(f"Session directory write test failed: {str(e)}")
-    
-    # Test 3: Check session files
-    if session.get('game_id'):
-        try:
-            session_files = [f for f in os.listdir(SESSION_DIR) if f.startswith('sess')]
-            test_results["session_file_details"] = {
-                "files_found": len(session_files),
-                "files": session_files
-            }
-        except Exception as e:
-            debug_log(f"Error listing session files: {str(e)}")
-        
-        # Test 4: Check game log file
-        log_filepath = session.get('log_filepath')
-        if log_filepath:
-            try:
-                test_results["game_log_details"] = {
-                    "exists": os.path.exists(log_filepath),
-                    "path": log_filepath,
-                    "permissions": oct(os.stat(log_filepath).st_mode)[-3:] if os.path.exists(log_filepath) else None,
-                    "directory_writable": os.access(os.path.dirname(log_filepath), os.W_OK)
-                }
-            except Exception as e:
-                debug_log(f"Error checking log file: {str(e)}")
+    logger.debug("Accessing index page")
+    logger.debug("Current session state: %s", session)  # Add session logging
+    return cached_response(render_cache.page('index.html'))
+
+@app.route('/healthz')
+def healthz():
+    """Load balancer health check: the cached result of the last writability and disk probe"""
+    problems = diagnostics.problems()
+    body = 'unhealthy: ' + '; '.join(problems) if problems else 'ok'
+    return Response(body, status=503 if problems else 200, mimetype='text/plain',
+                    headers={'Cache-Control': 'no-store'})
+
+@app.route('/diagnostics')
+def diagnostics_report():
+    """Storage, session store, log writer and disk status of this worker"""
+    if not admin_authorized():
+        return "Unauthorized", 401
+    return jsonify(diagnostics.report())
+
+@app.route('/export')
+def export():
+    """Stream game logs as NDJSON or CSV, filtered by start_from/start_to/completed/biased_quadrant"""
+    if not admin_authorized():
+        return "Unauthorized", 401
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return "Unknown format", 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError:
+        return "Invalid filter", 400
     
-    debug_log(f"Session test results: {test_results}")
-    return jsonify(test_results)
+    return Response(
+        stream_with_context(export_games(game_logger.storage, fmt, **filters)),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=games.{fmt}'}
+    )
+
+@app.route('/admin/dashboard')
+def dashboard():
+    """Live study totals; reads a fixed-size counter snapshot, whatever the number of games"""
+    if not admin_authorized():
+        return "Unauthorized", 401
+    stats = study_stats.summary()
+    if request.args.get('format') == 'json':
+        return jsonify(stats)
+    return render_template('dashboard.html', stats=stats, token=request.args.get('token', ''))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text metrics, aggregated over all worker processes"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/start')
 def start():
     try:
-        # Create new game log file
-        game_id, log_filepath = game_logger.create_game_log()
-        
-        # Store absolute filepath in session
-        session['game_id'] = game_id
-        session['log_filepath'] = log_filepath
-        session.modified = True
+        # Initialize game; the session (or token) only keeps what is needed to regenerate it
+        task = task_pool.get(**GAME_CONFIG)
         
-        # Add this debug print
-        print(f"Session after setting game info: {dict(session)}", flush=True)
+        # Create new game log file, recording the seed so the game can be reproduced
+        start_time = datetime.utcnow().isoformat()
+        game_id, log_filepath = game_logger.create_game_log(
+            metadata=dict(task.get_params(), biased_quadrant=task.biased_quadrant), start_time=start_time)
         
-        # Initialize game
-        task = VSTtask(n_rounds=5, n_quadrants=4, n_queues=1)
-        session['game'] = {
-            'rounds': task.rounds,
-            'biased_quadrant': task.biased_quadrant,
-            'n_rounds': task.n_rounds,
-            'n_quadrants': task.n_quadrants,
-            'current_round': 0,
-            'task_description': task.get_task_description()
+        state = {
+            'game_id': game_id,
+            'start_time': start_time,
+            'log_filepath': log_filepath,
+            'game': dict(task.get_params(), current_round=0, final_choice=None)
         }
         
-        # Add another debug print
-        print(f"Session after setting game data: {dict(session)}", flush=True)
+        if SINGLE_PAGE_RUNNER:
+            response = redirect(url_for('play'))
+        else:
+            response = redirect(url_for('round_page', round_number=0))
+        
+        if STATELESS_GAMES:
+            return game_tokens.set_cookie(response, state)
+        
+        # Store absolute filepath in session
+        session.update(state)
+        session.modified = True
         
-        return redirect(url_for('round_page', round_number=0))
+        # Add this debug print
+        logger.debug("Session after setting game data: %s", session)
+        return response
     except Exception as e:
-        print(f"Error in start route: {str(e)}", flush=True)
+        logger.exception("Error in start route: %s", e)
         raise
 
 @app.route('/log_choice', methods=['POST'])
@@ -191,17 +267,12 @@ def log_choice():
         if data is None:
             return "No data provided", 400
             
-        # Test file write in same location as game logs
-        test_path = os.path.join(LOGS_DIR, 'test_write.txt')
-        with open(test_path, 'a') as f:
-            f.write(f"Test write at {datetime.utcnow()}\n")
-        
-        # Now try the regular game logging
-        log_filepath = session.get('log_filepath')
+        state = game_state()
+        log_filepath = state.get('log_filepath')
         if not log_filepath:
             return "No active game session", 400
         
-        data['game_id'] = session.get('game_id')
+        data['game_id'] = state.get('game_id')
         success = game_logger.log_choice(log_filepath, data)
         
         if not success:
@@ -209,79 +280,171 @@ def log_choice():
         
         return "OK", 200
     except Exception as e:
-        print(f"Error: {str(e)}")  # Print to server logs
+        logger.exception("Error logging choice: %s", e)
+        return str(e), 500
+
+@app.route('/log_choices', methods=['POST'])
+def log_choices():
+    """Batched choice ingestion; also accepts navigator.sendBeacon bodies"""
+    try:
+        # sendBeacon may not send a JSON content type, so parse the body directly
+        data = json.loads(request.get_data() or b'null')
+        if isinstance(data, dict):
+            data = data.get('events')
+        if not isinstance(data, list) or not all(isinstance(event, dict) for event in data):
+            return "Expected a list of choice events", 400
+        if len(data) > MAX_LOG_BATCH:
+            return "Too many events", 413
+        
+        state = game_state()
+        log_filepath = state.get('log_filepath')
+        if not log_filepath:
+            return "No active game session", 400
+        
+        # Whole batches only: the client re-sends it as is after a 503, without duplicates
+        busy = "Busy, retry later", 503, {'Retry-After': '1'}
+        if game_logger.writer is not None and not game_logger.writer.has_room(len(data)):
+            return busy
+
+        game_id = state.get('game_id')
+        for event in data:
+            event['game_id'] = game_id
+        accepted = game_logger.log_choices(log_filepath, data)
+        
+        if accepted < len(data):
+            # Nothing of the batch was kept; with the async writer the queue filled up meanwhile
+            return busy if game_logger.writer is not None else ("Logging failed", 500)
+        
+        return "OK", 200
+    except ValueError:
+        return "Invalid JSON", 400
+    except Exception as e:
+        logger.exception("Error logging choices: %s", e)
         return str(e), 500
 
+@app.route('/api/game')
+def game_api():
+    """All rounds of the current game in one payload"""
+    state = game_state()
+    game = state.get('game')
+    if not game:
+        return jsonify({'error': 'No active game session'}), 400
+    
+    task = game_task(game)
+    return jsonify({
+        'game_id': state.get('game_id'),
+        'n_rounds': task.n_rounds,
+        'n_quadrants': task.n_quadrants,
+        'rounds': [task.get_round_data(n).to_dict() for n in range(task.n_rounds)]
+    })
+
+@app.route('/play')
+def play():
+    """Single page that runs every round client-side"""
+    if not game_state().get('game'):
+        return redirect(url_for('index'))
+    return cached_response(render_cache.page('round.html', runner=True))
+
 @app.route('/round/<int:round_number>', methods=['GET'])
 def round_page(round_number):
-    debug_log(f"Accessing round {round_number}")
+    logger.debug("Accessing round %d", round_number)
     try:
-        game = session.get('game')
+        state = game_state()
+        game = state.get('game')
         if not game:
-            debug_log("No game in session")
-            debug_log(f"Current session: {dict(session)}")
+            logger.debug("No game in session")
+            logger.debug("Current session: %s", state)
             return redirect(url_for('index'))
             
         if round_number >= game['n_rounds']:
-            debug_log("Round number exceeds max rounds")
+            logger.debug("Round number exceeds max rounds")
             return redirect(url_for('final'))
             
-        round_data = game['rounds'][round_number]
-        return render_template('round.html', round_number=round_number, round_data=round_data)
+        round_data = game_task(game).get_round_data(round_number)
+        n_queues = cues_per_round(game)
+        response = cached_response(render_cache.fill(
+            'round.html', n_queues, round_context(n_queues),
+            round_values(round_number, round_data, state.get('game_id'))))
+        if STATELESS_GAMES and round_number > game['current_round']:
+            # Progress lives in the token, so advancing it means reissuing the cookie
+            game['current_round'] = round_number
+            game_tokens.set_cookie(response, state)
+        return response
     except Exception as e:
-        debug_log(f"Error in round_page route: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error in round_page route: %s", e)
         raise
 
 @app.route('/final', methods=['GET', 'POST'])
 def final():
-    debug_log("Processing final route")
+    logger.debug("Processing final route")
     try:
-        game = session.get('game')
+        state = game_state()
+        game = state.get('game')
         if not game:
-            debug_log("No game in session at final page")
-            debug_log(f"Current session: {dict(session)}")
+            logger.debug("No game in session at final page")
+            logger.debug("Current session: %s", state)
             return redirect(url_for('index'))
         
         if request.method == 'POST':
+            biased_quadrant = game_task(game).biased_quadrant
+            if STATELESS_GAMES and game.get('final_choice') is None:
+                # A token saved before /final can be replayed, so the log has the last word
+                logged = game_logger.final_choice(state['log_filepath'])
+                if logged is not None:
+                    game['final_choice'] = logged.get('chosen_quadrant', -1)
+            if game.get('final_choice') is not None:
+                # Re-submitted (back button, double click): show the recorded answer, log nothing
+                chosen = game['final_choice']
+                correct = (chosen == biased_quadrant)
+                return render_template('result.html', chosen=chosen, correct=correct,
+                                       score=100 if correct else -100, biased=biased_quadrant)
+
             try:
                 chosen = int(request.form.get('biased_quadrant'))
             except (ValueError, TypeError):
-                debug_log("Invalid quadrant choice submitted")
+                logger.info("Invalid quadrant choice submitted")
                 chosen = -1
                 
-            correct = (chosen == game['biased_quadrant'])
+            correct = (chosen == biased_quadrant)
             score = 100 if correct else -100
             
             # Log the final result
-            log_filepath = session.get('log_filepath')
+            log_filepath = state.get('log_filepath')
             if log_filepath:
                 result_data = {
                     'type': 'final_choice',
                     'chosen_quadrant': chosen,
                     'correct': correct,
                     'score': score,
-                    'biased_quadrant': game['biased_quadrant']
+                    'biased_quadrant': biased_quadrant
                 }
                 success = game_logger.log_choice(log_filepath, result_data)
                 if not success:
-                    debug_log("Failed to log final choice")
+                    logger.error("Failed to log final choice")
             else:
-                debug_log("No log_filepath in session for final choice")
-                debug_log(f"Current session: {dict(session)}")
+                logger.warning("No log_filepath in session for final choice")
+                logger.debug("Current session: %s", state)
             
-            debug_log(f"Game completed - Chosen: {chosen}, Correct: {correct}, Score: {score}")
-            return render_template('result.html', chosen=chosen, correct=correct, 
-                                score=score, biased=game['biased_quadrant'])
+            logger.info("Game completed - Chosen: %d, Correct: %s, Score: %d", chosen, correct, score)
+            game['final_choice'] = chosen
+            response = make_response(render_template('result.html', chosen=chosen, correct=correct,
+                                                     score=score, biased=biased_quadrant))
+            if STATELESS_GAMES:
+                game_tokens.set_cookie(response, state)
+            else:
+                # A change inside the nested game dict is not noticed by the session
+                session.modified = True
+            return response
                                 
-        return render_template('final.html', n_quadrants=game['n_quadrants'])
+        return cached_response(render_cache.page('final.html', n_quadrants=game['n_quadrants']))
     except Exception as e:
-        debug_log(f"Error in final route: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error in final route: %s", e)
         raise
 
 if __name__ == '__main__':
-    debug_log("Starting Flask application")
+    logger.info("Starting Flask application")
     try:
         app.run(host='0.0.0.0', port=8080, debug=True)  # Changed host and port
     except Exception as e:
-        debug_log(f"Error starting Flask app: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error starting Flask app: %s", e)
         raise
\ No newline at end of file
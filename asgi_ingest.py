@@ -0,0 +1,303 @@
+"""ASGI entry point: asyncio-served choice ingestion in front of the Flask app.
+
+POST /log_choice and /log_choices are handled on the event loop. The game
+is found from the signed game token (stateless mode) or the session store,
+choices go to the GameLogger's background writer without blocking (or to an
+executor when the writer is synchronous), and a full writer queue is
+answered with 503 + Retry-After instead of tying up a connection. Every
+other route runs the Flask app in a thread pool, so one process serves the
+whole study and can hold thousands of idle participant connections:
+
+    uvicorn asgi_ingest:app --host 0.0.0.0 --port 8080
+"""
+import io
+import sys
+import json
+import time
+import asyncio
+import threading
+from http import HTTPStatus
+from http.cookies import SimpleCookie, CookieError
+from concurrent.futures import ThreadPoolExecutor
+
+import app as wsgi
+from app import app as flask_app, game_logger, STATELESS_GAMES
+from utils.config import MAX_LOG_BATCH, ASGI_WSGI_THREADS, ASGI_MAX_BODY, ASGI_QUEUE_HIGH_WATER
+from utils.AppLog import get_logger
+from utils.GameToken import GameTokens
+from utils.Metrics import metrics
+from utils.SessionStore import StoreSessionInterface
+
+logger = get_logger('asgi')
+
+INGEST_PATHS = {'/log_choice': 'log_choice', '/log_choices': 'log_choices'}
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='wsgi')
+_END = object()
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class _ClientGone(Exception):
+    pass
+
+
+async def _read_body(receive, limit=None):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise _BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _respond(send, status, body=b'', headers=()):
+    if isinstance(body, str):
+        body = body.encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/html; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode())] + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _cookies(scope):
+    cookie = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            try:
+                cookie.load(value.decode('latin-1'))
+            except CookieError:
+                pass
+    return {key: morsel.value for key, morsel in cookie.items()}
+
+
+async def _game_state(scope):
+    """The {'game_id', 'log_filepath', ...} the Flask routes would see, or None"""
+    cookies = _cookies(scope)
+    if STATELESS_GAMES:
+        return wsgi.token_state(wsgi.game_tokens.loads(cookies.get(GameTokens.COOKIE)))
+    interface = flask_app.session_interface
+    cookie = cookies.get(interface.get_cookie_name(flask_app))
+    loop = asyncio.get_running_loop()
+    loaded = await loop.run_in_executor(_executor, interface.load, flask_app, cookie)
+    return loaded[1] if loaded else None
+
+
+def _writer_saturated():
+    writer = game_logger.writer
+    return writer is not None and writer.queue_depth >= writer.max_queue * ASGI_QUEUE_HIGH_WATER
+
+
+async def _ingest(scope, receive, send, endpoint):
+    """Native /log_choice and /log_choices; same answers as the Flask routes"""
+    if scope['method'] != 'POST':
+        return await _respond(send, 405, 'Method Not Allowed', [(b'allow', b'POST')])
+    try:
+        body = await _read_body(receive, ASGI_MAX_BODY)
+    except _BodyTooLarge:
+        return await _respond(send, 413, 'Request too large')
+    if _writer_saturated():
+        # Backpressure: the client retries later instead of the request waiting for queue space
+        return await _respond(send, 503, 'Busy, retry later', [(b'retry-after', b'1')])
+    try:
+        data = json.loads(body or b'null')
+    except ValueError:
+        return await _respond(send, 400, 'Invalid JSON')
+
+    if endpoint == 'log_choice':
+        if data is None:
+            return await _respond(send, 400, 'No data provided')
+        if not isinstance(data, dict):
+            return await _respond(send, 400, 'Expected a choice event')
+        events = [data]
+    else:
+        if isinstance(data, dict):
+            data = data.get('events')
+        if not isinstance(data, list) or not all(isinstance(event, dict) for event in data):
+            return await _respond(send, 400, 'Expected a list of choice events')
+        if len(data) > MAX_LOG_BATCH:
+            return await _respond(send, 413, 'Too many events')
+        events = data
+
+    state = await _game_state(scope)
+    log_filepath = (state or {}).get('log_filepath')
+    if not log_filepath:
+        return await _respond(send, 400, 'No active game session')
+    for event in events:
+        event['game_id'] = state.get('game_id')
+
+    if game_logger.writer is not None:
+        # Only enqueues; never waits for queue space on the event loop
+        accepted = game_logger.log_choices(log_filepath, events, timeout=0)
+    else:
+        loop = asyncio.get_running_loop()
+        accepted = await loop.run_in_executor(_executor, game_logger.log_choices, log_filepath, events)
+    if accepted < len(events):
+        # Batches are all or nothing, so the client can retry the same events
+        if game_logger.writer is not None:
+            return await _respond(send, 503, 'Busy, retry later', [(b'retry-after', b'1')])
+        return await _respond(send, 500, 'Logging failed')
+    return await _respond(send, 200, 'OK')
+
+
+def _environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+async def _call_flask(scope, receive, send):
+    """Run the Flask app in the thread pool, streaming its response body back"""
+    body = await _read_body(receive)
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=8)
+    started = loop.create_future()
+    cancelled = threading.Event()
+
+    def put(item):
+        # Blocks this worker thread while the client is slow to read
+        if cancelled.is_set():
+            raise _ClientGone()
+        asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+    def fail(error):
+        if not started.done():
+            started.set_exception(error)
+        else:
+            # Headers are out; end the body where the app stopped
+            asyncio.ensure_future(chunks.put(_END))
+
+    def run():
+        def start_response(status, headers, exc_info=None):
+            loop.call_soon_threadsafe(started.set_result, (status, headers))
+            return put
+        try:
+            # Iterated in this one thread, so Flask's context-bound generators stay valid
+            result = flask_app(_environ(scope, body), start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        put(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            put(_END)
+        except _ClientGone:
+            pass
+        except Exception as e:
+            logger.exception("Error running %s %s: %s", scope['method'], scope['path'], e)
+            loop.call_soon_threadsafe(fail, e)
+
+    loop.run_in_executor(_executor, run)
+    try:
+        status, headers = await started
+    except Exception:
+        return await _respond(send, 500, HTTPStatus.INTERNAL_SERVER_ERROR.phrase)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        })
+        while True:
+            chunk = await chunks.get()
+            if chunk is _END:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        # Let a producer stuck on a full queue finish if the client went away
+        cancelled.set()
+        while not chunks.empty():
+            chunks.get_nowait()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(_executor, wsgi.warm_up)
+            await loop.run_in_executor(_executor, wsgi.warm_worker)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            game_logger.flush()
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def _native_ingest_supported():
+    # Flask-Session's filesystem sessions are only readable through Flask itself
+    return STATELESS_GAMES or isinstance(flask_app.session_interface, StoreSessionInterface)
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    endpoint = INGEST_PATHS.get(scope['path'])
+    if endpoint is None or not _native_ingest_supported():
+        return await _call_flask(scope, receive, send)
+
+    start = time.perf_counter()
+    status = {}
+
+    async def timed_send(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+        await send(message)
+
+    try:
+        await _ingest(scope, receive, timed_send, endpoint)
+    except Exception as e:
+        logger.exception("Error in async %s: %s", endpoint, e)
+        if 'code' not in status:
+            await _respond(timed_send, 500, HTTPStatus.INTERNAL_SERVER_ERROR.phrase)
+    metrics.observe('trt_http_request_duration_seconds', time.perf_counter() - start, {'endpoint': endpoint})
+    metrics.inc('trt_http_requests_total', {'endpoint': endpoint, 'status': status.get('code', 500)})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi_ingest:app', host='0.0.0.0', port=8080)
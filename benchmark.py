@@ -0,0 +1,290 @@
+"""Load test: simulated participants playing full games against the app.
+
+Each participant runs /start, every round (page flow: /round/<n> + /log_choice,
+or single-page flow: /play + /api/game + /log_choices) and the /final POST.
+Runs in-process against the Flask test client, against a locally spawned
+gunicorn or against the single-process ASGI server (asgi_ingest.py under
+uvicorn), for every combination of storage and session backend, and writes
+per-endpoint throughput and p50/p95/p99 latencies as JSON so runs can be diffed
+between commits:
+
+    python benchmark.py --participants 200 --target client gunicorn asgi \\
+        --storage sharded sqlite --session sqlite memory --output bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import secrets
+import argparse
+import tempfile
+import itertools
+import subprocess
+import http.cookiejar
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestClientSession:
+    """One participant's cookie jar on the Flask test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, json_body=None):
+        response = self.client.open(path, method=method, data=data, json=json_body)
+        return response.status_code, response.get_data()
+
+
+class HTTPSession:
+    """One participant's cookie jar against a running server"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+        class NoRedirect(urllib.request.HTTPRedirectHandler):
+            def redirect_request(self, *args, **kwargs):
+                return None
+
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, method, path, data=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def play_game(session, flow, timings):
+    """Play one full game, appending (endpoint, seconds, status) to timings"""
+    def call(name, method, path, **kwargs):
+        start = time.perf_counter()
+        status, body = session.request(method, path, **kwargs)
+        timings.append((name, time.perf_counter() - start, status))
+        return status, body
+
+    call('GET /start', 'GET', '/start')
+    if flow == 'spa':
+        call('GET /play', 'GET', '/play')
+        status, body = call('GET /api/game', 'GET', '/api/game')
+        rounds = json.loads(body)['rounds'] if status == 200 else []
+        events = [{'round': n, 'quadrant': r['queues'][0]['quadrant'], 'choice': r['queues'][0]['name'],
+                   'color': r['queues'][0]['color'], 'client_timestamp': '2026-01-01T00:00:00Z'}
+                  for n, r in enumerate(rounds)]
+        call('POST /log_choices', 'POST', '/log_choices', json_body=events)
+    else:
+        for n in itertools.count():
+            status, _ = call('GET /round/<n>', 'GET', f'/round/{n}')
+            if status != 200:
+                break
+            call('POST /log_choice', 'POST', '/log_choice', json_body={
+                'round': n, 'quadrant': 0, 'choice': 'A', 'color': 'RED',
+                'client_timestamp': '2026-01-01T00:00:00Z'})
+    call('GET /final', 'GET', '/final')
+    call('POST /final', 'POST', '/final', data={'biased_quadrant': '0'})
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarise(timings, wall_time, participants):
+    endpoints = {}
+    for name, seconds, status in timings:
+        entry = endpoints.setdefault(name, {'latencies': [], 'errors': 0})
+        entry['latencies'].append(seconds)
+        # Redirects are part of the normal flow
+        if status >= 400:
+            entry['errors'] += 1
+    report = {}
+    for name, entry in sorted(endpoints.items()):
+        latencies = sorted(entry['latencies'])
+        report[name] = {
+            'requests': len(latencies),
+            'errors': entry['errors'],
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    return {
+        'participants': participants,
+        'requests': len(timings),
+        'errors': sum(e['errors'] for e in report.values()),
+        'wall_time_s': wall_time,
+        'requests_per_s': len(timings) / wall_time,
+        'games_per_s': participants / wall_time,
+        'endpoints': report,
+    }
+
+
+def run_participants(make_session, participants, concurrency, flow):
+    timings = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(play_game, make_session(), flow, timings) for _ in range(participants)]:
+            future.result()
+    return summarise(timings, time.perf_counter() - start, participants)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_serving(port, timeout=30.0):
+    """Seconds until the server answers its first page"""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5) as response:
+                if response.status == 200:
+                    return time.monotonic() - start
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def server_command(args, port):
+    if args.target == 'asgi':
+        return [sys.executable, '-m', 'uvicorn', 'asgi_ingest:app', '--port', str(port),
+                '--no-access-log', '--log-level', 'warning']
+    # The production settings (preloaded, warmed app), with this run's workers and port
+    return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app',
+            '-w', str(args.workers), '-b', f'127.0.0.1:{port}']
+
+
+def run_server(args, env):
+    port = _free_port()
+    server = subprocess.Popen(server_command(args, port), cwd=BASE_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        startup = _wait_until_serving(port)
+        result = run_participants(lambda: HTTPSession(f'http://127.0.0.1:{port}'),
+                                  args.participants, args.concurrency, args.flow)
+        result['startup_s'] = round(startup, 3)
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def run_single(args):
+    """One configuration, in this process (the backends were chosen through the environment)"""
+    if args.target == 'client':
+        from app import app
+        result = run_participants(lambda: TestClientSession(app), args.participants, args.concurrency, args.flow)
+        from app import game_logger
+        game_logger.flush()
+    else:
+        result = run_server(args, os.environ.copy())
+    print(json.dumps(result))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app with simulated participants')
+    parser.add_argument('--participants', type=int, default=200, help='games played per configuration')
+    parser.add_argument('--concurrency', type=int, default=None, help='simultaneous participants (default: all)')
+    parser.add_argument('--flow', choices=['pages', 'spa'], default='pages',
+                        help='per-round pages or the single-page runner API')
+    parser.add_argument('--target', nargs='+', choices=['client', 'gunicorn', 'asgi'], default=['client'])
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--storage', nargs='+', choices=['sharded', 'json', 'sqlite'], default=['sharded'])
+    parser.add_argument('--session', nargs='+', choices=['sqlite', 'memory', 'filesystem'], default=['sqlite'])
+    parser.add_argument('--writer', nargs='+', choices=['async', 'sync'], default=['async'])
+    parser.add_argument('--game-state', nargs='+', choices=['session', 'stateless'], default=['session'],
+                        help='keep game state in the session or in a signed token')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.concurrency = args.concurrency or args.participants
+
+    if args.single:
+        args.target = args.target[0]
+        run_single(args)
+        return
+
+    runs = []
+    for target, storage, session, writer, game_state in itertools.product(
+            args.target, args.storage, args.session, args.writer, args.game_state):
+        if game_state == 'stateless' and session != args.session[0]:
+            # The session backend is unused with stateless games
+            continue
+        if target == 'gunicorn' and session == 'memory' and game_state == 'session' and args.workers > 1:
+            print(f"Skipping gunicorn/{storage}/memory: in-process sessions need a single worker")
+            continue
+        data_dir = tempfile.mkdtemp(prefix='trt-bench-')
+        env = dict(os.environ,
+                   TRT_LOG_BACKEND=storage, TRT_SESSION_BACKEND=session, TRT_WRITER_MODE=writer,
+                   TRT_STATELESS_GAMES='1' if game_state == 'stateless' else '0',
+                   TRT_LOGS_DIR=os.path.join(data_dir, 'logs'),
+                   TRT_SESSION_DIR=os.path.join(data_dir, 'flask_session'),
+                   TRT_GAME_LOGS_DIR=os.path.join(data_dir, 'games'),
+                   TRT_PIDFILE=os.path.join(data_dir, 'gunicorn.pid'),
+                   TRT_DEBUG_LOG=os.path.join(data_dir, 'flask_debug.log'),
+                   TRT_LOG_LEVEL='WARNING')
+        # Stateless games refuse to start with the built-in secret key
+        env.setdefault('TRT_SECRET_KEY', secrets.token_hex(32))
+        # Each configuration runs in a fresh process, since backends are chosen at import time
+        command = [sys.executable, os.path.abspath(__file__), '--single', '--target', target,
+                   '--participants', str(args.participants), '--concurrency', str(args.concurrency),
+                   '--flow', args.flow, '--workers', str(args.workers)]
+        try:
+            output = subprocess.run(command, cwd=BASE_DIR, env=env, check=True,
+                                    capture_output=True, text=True).stdout
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+        result = json.loads(output.strip().splitlines()[-1])
+        if game_state == 'stateless':
+            session = 'none'
+        result.update(target=target, storage=storage, session=session, writer=writer, game_state=game_state,
+                      workers=args.workers if target == 'gunicorn' else 1)
+        runs.append(result)
+        print(f"{target:>8} storage={storage:<7} session={session:<10} writer={writer:<5} state={game_state:<9} "
+              f"{result['requests_per_s']:8.1f} req/s {result['games_per_s']:7.1f} games/s "
+              f"errors={result['errors']}" + (f" startup={result['startup_s']:.2f}s" if 'startup_s' in result else ''))
+        for name, stats in result['endpoints'].items():
+            print(f"    {name:<20} n={stats['requests']:<6} p50={stats['p50_ms']:7.2f}ms "
+                  f"p95={stats['p95_ms']:7.2f}ms p99={stats['p99_ms']:7.2f}ms")
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'participants': args.participants,
+            'concurrency': args.concurrency,
+            'flow': args.flow,
+            'runs': runs,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""gunicorn settings: app preloaded and warmed in the master, workers forked warm.
+
+The app is imported once in the master (directories, storage, session store,
+precompressed static files), warm_up() compiles the templates and fills the
+page cache, then workers are forked with all of it already in memory and
+each fills its own task pool before taking requests. Boot times are logged
+and recorded as trt_span_duration_seconds{span="master_boot"|"worker_boot"}.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Reload without dropping connections with restart.sh (USR2, then TERM to the
+old master); HUP would not pick up new code, since the app is preloaded.
+"""
+import os
+import time
+
+_boot_start = time.perf_counter()
+
+bind = os.environ.get('TRT_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('TRT_WORKERS', '4'))
+preload_app = True
+pidfile = os.environ.get('TRT_PIDFILE', 'logs/gunicorn.pid')
+# In-flight requests of replaced workers get this long to finish
+graceful_timeout = 30
+
+
+def when_ready(server):
+    from app import warm_up
+    from utils.Metrics import metrics
+    warm_up()
+    elapsed = time.perf_counter() - _boot_start
+    metrics.observe('trt_span_duration_seconds', elapsed, {'span': 'master_boot'})
+    server.log.info("Master %d ready in %.3fs (app preloaded and warmed)", os.getpid(), elapsed)
+
+
+def post_fork(server, worker):
+    worker.boot_start = time.perf_counter()
+    from app import warm_worker
+    warm_worker()
+
+
+def post_worker_init(worker):
+    from utils.Metrics import metrics
+    elapsed = time.perf_counter() - worker.boot_start
+    metrics.observe('trt_span_duration_seconds', elapsed, {'span': 'worker_boot'})
+    worker.log.info("Worker %d ready in %.3fs", worker.pid, elapsed)
@@ -13,18 +13,49 @@ if command -v conda &> /dev/null; then
     conda activate vst || echo "Warning: Could not activate conda environment"
 fi
 
-# Kill any running gunicorn processes
-echo "Stopping any running gunicorn processes..."
-pkill -f gunicorn || true
-sleep 2
+PIDFILE=logs/gunicorn.pid
+START=$(date +%s.%N)
 
-# Start gunicorn in background
-echo "Starting gunicorn..."
-gunicorn app:app -w 4 -b 127.0.0.1:8000 > logs/gunicorn.log 2>&1 &
+if [ -f "$PIDFILE" ] && kill -0 "$(cat "$PIDFILE")" 2>/dev/null; then
+    # Zero-downtime reload: a new master boots next to the old one and shares its sockets
+    OLD_PID=$(cat "$PIDFILE")
+    echo "Reloading gunicorn (master $OLD_PID)..."
+    kill -USR2 "$OLD_PID"
 
-# Restart nginx
-echo "Restarting nginx..."
-sudo systemctl restart nginx
+    # The new master writes $PIDFILE.2 once the app is preloaded, then forks its workers
+    NEW_PID=""
+    for _ in $(seq 1 120); do
+        if [ -f "$PIDFILE.2" ]; then
+            NEW_PID=$(cat "$PIDFILE.2")
+            [ "$(pgrep -P "$NEW_PID" | wc -l)" -ge "${TRT_WORKERS:-4}" ] && break
+        fi
+        sleep 0.5
+    done
+    if [ -z "$NEW_PID" ]; then
+        echo "New gunicorn master did not start; the old one keeps serving. See logs/gunicorn.log"
+        exit 1
+    fi
+
+    # Old workers finish their in-flight requests, then the old master exits
+    echo "New master $NEW_PID is up; stopping old master $OLD_PID gracefully..."
+    kill -TERM "$OLD_PID"
+else
+    # A gunicorn started without the pidfile (older restart.sh) has to go first
+    pkill -f "gunicorn app:app" && sleep 2
+    echo "Starting gunicorn..."
+    gunicorn -c gunicorn.conf.py app:app >> logs/gunicorn.log 2>&1 &
+    for _ in $(seq 1 120); do
+        [ -f "$PIDFILE" ] && break
+        sleep 0.5
+    done
+fi
+
+awk -v start="$START" -v end="$(date +%s.%N)" 'BEGIN { printf "gunicorn up in %.2fs\n", end - start }'
+grep -E "ready in" logs/gunicorn.log | tail -n "$(( ${TRT_WORKERS:-4} + 1 ))"
+
+# Reload nginx (graceful, unlike a restart it keeps open connections)
+echo "Reloading nginx..."
+sudo systemctl reload nginx
 
 echo "Server restart complete!"
-echo "To check server status, use: ps aux | grep gunicorn"
\ No newline at end of file
+echo "To check server status, use: ps aux | grep gunicorn (master pid in $PIDFILE)"
\ No newline at end of file
@@ -0,0 +1,171 @@
+// Client-side round runner: loads the whole game once from /api/game, switches
+// rounds in place and sends choices to /log_choices in batches. When the game
+// ends the rest is sent (and re-sent on 503) before moving on to /final; only
+// a page being hidden mid-game falls back to navigator.sendBeacon.
+(function (window, document) {
+    'use strict';
+
+    function RoundRunner(options) {
+        this.gameUrl = options.gameUrl;
+        this.logUrl = options.logUrl;
+        this.finalUrl = options.finalUrl;
+        this.batchSize = options.batchSize || 20;
+        this.nextDelay = options.nextDelay || 500;
+        this.finishRetries = options.finishRetries || 10;
+        this.title = document.getElementById('round-title');
+        this.cues = document.getElementById('cues');
+        this.buffer = [];
+        this.game = null;
+        this.roundShownAt = 0;
+
+        var runner = this;
+        window.addEventListener('pagehide', function () {
+            runner.flush(true);
+        });
+    }
+
+    RoundRunner.prototype.start = function () {
+        var runner = this;
+        return fetch(this.gameUrl, { credentials: 'same-origin' })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('Could not load game: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(function (game) {
+                runner.game = game;
+                runner.showRound(0);
+            })
+            .catch(function (error) {
+                console.error(error);
+                window.location.href = '/';
+            });
+    };
+
+    RoundRunner.prototype.showRound = function (roundNumber) {
+        var runner = this;
+        var rounds = this.game.rounds;
+        if (roundNumber >= rounds.length) {
+            this.finish();
+            return;
+        }
+
+        var queues = rounds[roundNumber].queues;
+        this.title.textContent = 'Round ' + (roundNumber + 1);
+        this.cues.className = 'queues-' + queues.length;
+        this.cues.innerHTML = '';
+
+        var answered = false;
+        queues.forEach(function (cue) {
+            var button = document.createElement('button');
+            button.className = 'cue-button';
+            button.textContent = cue.name;
+            button.addEventListener('click', function () {
+                if (answered) return;
+                answered = true;
+
+                button.style.backgroundColor = cue.color.toLowerCase();
+                button.textContent += ' (' + cue.color + ')';
+
+                runner.record({
+                    round: roundNumber,
+                    quadrant: cue.quadrant,
+                    choice: cue.name,
+                    color: cue.color,
+                    client_timestamp: new Date().toISOString(),
+                    reaction_time_ms: Math.round(window.performance.now() - runner.roundShownAt)
+                });
+
+                setTimeout(function () {
+                    runner.showRound(roundNumber + 1);
+                }, runner.nextDelay);
+            });
+            runner.cues.appendChild(button);
+        });
+        this.roundShownAt = window.performance.now();
+    };
+
+    RoundRunner.prototype.record = function (event) {
+        this.buffer.push(event);
+        if (this.buffer.length >= this.batchSize) {
+            this.flush(false);
+        }
+    };
+
+    RoundRunner.prototype.flush = function (useBeacon) {
+        if (!this.buffer.length) return;
+        var runner = this;
+        var events = stamp(this.buffer);
+        var payload = JSON.stringify(events);
+        this.buffer = [];
+
+        if (useBeacon && navigator.sendBeacon &&
+                navigator.sendBeacon(this.logUrl, new Blob([payload], { type: 'application/json' }))) {
+            return;
+        }
+        this.post(payload).then(function (response) {
+            if (response.status === 503) {
+                // Server is shedding load: keep the events and try again later
+                runner.buffer = events.concat(runner.buffer);
+                window.setTimeout(function () { runner.flush(false); }, retryAfter(response));
+            }
+        }).catch(function (error) {
+            console.error('Logging error:', error);
+        });
+    };
+
+    RoundRunner.prototype.post = function (payload) {
+        return fetch(this.logUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            keepalive: true,
+            headers: { 'Content-Type': 'application/json' },
+            body: payload
+        });
+    };
+
+    // Send whatever is buffered and wait for the server to accept it, retrying after each 503
+    RoundRunner.prototype.drain = function (retriesLeft) {
+        if (!this.buffer.length) return Promise.resolve();
+        var runner = this;
+        var events = stamp(this.buffer);
+        this.buffer = [];
+        return this.post(JSON.stringify(events)).then(function (response) {
+            if (response.status === 503 && retriesLeft > 0) {
+                runner.buffer = events.concat(runner.buffer);
+                return new Promise(function (resolve) {
+                    window.setTimeout(resolve, retryAfter(response));
+                }).then(function () {
+                    return runner.drain(retriesLeft - 1);
+                });
+            }
+            if (!response.ok) {
+                console.error('Logging failed:', response.status);
+            }
+        });
+    };
+
+    RoundRunner.prototype.finish = function () {
+        var runner = this;
+        // A beacon's response cannot be read, so the last batch goes by fetch and is confirmed first
+        this.drain(this.finishRetries).catch(function (error) {
+            console.error('Logging error:', error);
+        }).then(function () {
+            window.location.href = runner.finalUrl;
+        });
+    };
+
+    // sent_at marks when a batch left the browser; the dashboard's latency is measured from it
+    function stamp(events) {
+        var now = new Date().toISOString();
+        events.forEach(function (event) { event.sent_at = now; });
+        return events;
+    }
+
+    function retryAfter(response) {
+        return (parseInt(response.headers.get('Retry-After'), 10) || 1) * 1000;
+    }
+
+    window.RoundRunner = RoundRunner;
+})(window, document);
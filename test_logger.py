@@ -10,6 +10,21 @@ app = Flask(__name__)
 LOGS_DIR = os.path.join(os.path.dirname(__file__), 'test_logs')
 os.makedirs(LOGS_DIR, exist_ok=True)
 
+def shard_dir(log_id):
+    """Logs are sharded as <day>/<log_id prefix>/ so no directory grows without bound"""
+    path = os.path.join(LOGS_DIR, datetime.utcnow().strftime('%Y-%m-%d'), log_id[:2])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def latest_day_logs():
+    days = sorted(d for d in os.listdir(LOGS_DIR) if os.path.isdir(os.path.join(LOGS_DIR, d)))
+    if not days:
+        return []
+    day_dir = os.path.join(LOGS_DIR, days[-1])
+    return [os.path.join(day_dir, prefix, f)
+            for prefix in os.listdir(day_dir)
+            for f in os.listdir(os.path.join(day_dir, prefix)) if f.endswith('.json')]
+
 @app.route('/')
 def index():
     return '''
@@ -39,7 +54,7 @@ def create_log():
         # Generate unique filename
         log_id = str(uuid.uuid4())
         filename = f"log_{log_id}.json"
-        filepath = os.path.join(LOGS_DIR, filename)
+        filepath = os.path.join(shard_dir(log_id), filename)
         
         # Initial log structure
         log_data = {
@@ -68,16 +83,15 @@ def add_entry():
     try:
         message = request.form.get('message', 'No message provided')
         
-        # Find most recent log file
-        log_files = [f for f in os.listdir(LOGS_DIR) if f.endswith('.json')]
+        # Find most recent log file (only the newest day's shards need listing)
+        log_files = latest_day_logs()
         if not log_files:
             return jsonify({
                 'status': 'error',
                 'message': 'No log file exists. Create one first.'
             }), 400
             
-        latest_log = max(log_files, key=lambda x: os.path.getctime(os.path.join(LOGS_DIR, x)))
-        filepath = os.path.join(LOGS_DIR, latest_log)
+        filepath = max(log_files, key=os.path.getctime)
         
         # Read current log
         with open(filepath, 'r') as f:
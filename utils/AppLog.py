@@ -0,0 +1,99 @@
+import os
+import sys
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from .config import DEBUG_LOG, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from .PerProcess import PerProcess
+
+ROOT_LOGGER = 'trt'
+
+_lock = threading.Lock()
+_listener = None
+
+
+class LockedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Size-rotated log file shared by several worker processes.
+
+    Each write and rollover happens under an flock on '<file>.lock', and a
+    handler whose file was rotated away by another process reopens the new
+    one before writing, so workers never write into a rotated-out file or
+    rotate the same file twice.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self._lock_file = open(self.baseFilename + '.lock', 'a')
+
+    def _reopen_if_rotated(self):
+        try:
+            current = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            current = None
+        if self.stream is None or current is None or os.fstat(self.stream.fileno()).st_ino != current.st_ino:
+            if self.stream is not None:
+                self.stream.close()
+            self.stream = self._open()
+
+    def emit(self, record):
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                super().emit(record)
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+
+class _ProcessQueueHandler(logging.handlers.QueueHandler):
+    # The listener thread does not survive a fork, so start one per process
+    def enqueue(self, record):
+        _ensure_listener()
+        super().enqueue(record)
+
+
+_queue = queue.SimpleQueue()
+
+
+def _start_listener():
+    global _listener
+    formatter = logging.Formatter('%(asctime)s - %(process)d - %(levelname)s - %(name)s - %(message)s')
+    file_handler = LockedRotatingFileHandler(DEBUG_LOG, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    console_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    _listener = logging.handlers.QueueListener(_queue, file_handler, console_handler)
+    _listener.start()
+
+
+_listener_process = PerProcess(_start_listener)
+
+
+def _ensure_listener():
+    _listener_process.ensure()
+
+
+def _stop_listener():
+    if _listener is not None and _listener_process.started:
+        _listener.stop()
+
+
+def get_logger(name=None):
+    """Logger under the 'trt' hierarchy; records go through a queue to the file and stdout.
+
+    Use lazy %-style arguments (logger.debug("Session: %s", session)) so
+    nothing is formatted unless the level is enabled.
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    with _lock:
+        if not root.handlers:
+            root.setLevel(LOG_LEVEL)
+            root.addHandler(_ProcessQueueHandler(_queue))
+            root.propagate = False
+            atexit.register(_stop_listener)
+    return root.getChild(name) if name else root
\ No newline at end of file
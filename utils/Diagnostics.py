@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+from datetime import datetime
+from .config import HEALTH_PROBE_INTERVAL, HEALTH_MIN_FREE_MB
+from .AppLog import get_logger
+from .PerProcess import PerProcess
+
+logger = get_logger('Diagnostics')
+
+
+def probe_directory(path, min_free_bytes):
+    """Writability and free space of one directory: a tiny create/write/unlink plus a statvfs"""
+    result = {'path': path, 'writable': False, 'free_mb': None, 'total_mb': None, 'error': None}
+    probe = os.path.join(path, f'.healthz.{os.getpid()}')
+    try:
+        fd = os.open(probe, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o664)
+        try:
+            os.write(fd, b'ok')
+        finally:
+            os.close(fd)
+        os.unlink(probe)
+        result['writable'] = True
+        stats = os.statvfs(path)
+        result['free_mb'] = stats.f_bavail * stats.f_frsize // (1024 * 1024)
+        result['total_mb'] = stats.f_blocks * stats.f_frsize // (1024 * 1024)
+        if result['free_mb'] * 1024 * 1024 < min_free_bytes:
+            result['error'] = f"only {result['free_mb']} MB free"
+    except OSError as e:
+        result['error'] = str(e)
+    return result
+
+
+class Diagnostics:
+    """Cached health of the directories requests write to.
+
+    A background thread (started lazily and per process, like the log
+    writer's) probes every directory each `interval` seconds; healthy() and
+    report() only read the last result, so load balancers can poll /healthz
+    as often as they like. A probe older than three intervals counts as a
+    failure, since a hung disk would stall the probe thread itself.
+    """
+
+    def __init__(self, directories, game_logger, session_store=None, task_pool=None,
+                 interval=HEALTH_PROBE_INTERVAL, min_free_mb=HEALTH_MIN_FREE_MB):
+        self.directories = directories
+        self.game_logger = game_logger
+        self.session_store = session_store
+        self.task_pool = task_pool
+        self.interval = interval
+        self.min_free_bytes = min_free_mb * 1024 * 1024
+        self._process = PerProcess(self._start)
+        self._probes = {}
+        self._checked_at = None
+
+    def _start(self):
+        # One synchronous probe, so the first answer is never 'unknown'
+        self.probe()
+        threading.Thread(target=self._probe_forever, name='health-probe', daemon=True).start()
+
+    def start(self):
+        """Probe now and keep probing in the background (once per process)"""
+        self._process.ensure()
+
+    def probe(self):
+        probes = {name: probe_directory(path, self.min_free_bytes) for name, path in self.directories.items()}
+        for name, result in probes.items():
+            if result['error'] and not (self._probes.get(name) or {}).get('error'):
+                logger.warning("Health probe of %s (%s) failed: %s", name, result['path'], result['error'])
+        self._probes, self._checked_at = probes, time.monotonic()
+
+    def _probe_forever(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.probe()
+            except Exception as e:
+                logger.exception("Health probe failed: %s", e)
+
+    def problems(self):
+        """Reasons the last probe counts as unhealthy (empty when healthy)"""
+        self._process.ensure()
+        problems = [f"{name}: {result['error']}" for name, result in self._probes.items() if result['error']]
+        age = time.monotonic() - self._checked_at
+        if age > 3 * self.interval:
+            problems.append(f"last probe {age:.0f}s ago")
+        return problems
+
+    def healthy(self):
+        return not self.problems()
+
+    def report(self):
+        """Everything /diagnostics shows, from cached probes and maintained counters only"""
+        problems = self.problems()
+        sessions = None
+        if self.session_store is not None:
+            sessions = {'store': type(self.session_store).__name__, 'entries': self.session_store.size()}
+        return {
+            'healthy': not problems,
+            'problems': problems,
+            'worker_pid': os.getpid(),
+            'checked_seconds_ago': round(time.monotonic() - self._checked_at, 3),
+            'time': datetime.utcnow().isoformat(),
+            'storage': self.game_logger.storage.status(),
+            'sessions': sessions,
+            'log_writer': self.game_logger.writer_stats(),
+            'task_pool': self.task_pool.stats() if self.task_pool is not None else None,
+            'disk': self._probes,
+        }
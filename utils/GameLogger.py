@@ -1,67 +1,274 @@
-import os
-import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 import uuid
-import traceback
-from .config import LOGS_DIR, debug_log
+from .config import (GAME_LOGS_DIR, LOG_FORMAT, LOG_BACKEND, WRITER_MODE, WRITER_QUEUE_SIZE,
+                     WRITER_BATCH_SIZE, WRITER_PUT_TIMEOUT, WRITER_FSYNC, WRITER_FSYNC_INTERVAL_MS)
+from .LogStorage import make_storage
+from .AppLog import get_logger
+from .Metrics import metrics
+from .StudyStats import study_stats
+from .PerProcess import PerProcess
+
+logger = get_logger('GameLogger')
+
+
+class BackgroundWriter:
+    """Bounded queue of choices drained in batches into a LogStorage by a dedicated thread.
+
+    The bound is max_queue choices (not submissions); a batch is queued whole
+    or not at all, so a client never has to work out which of its events made it.
+
+    fsync_policy is 'always' (after every batch), 'interval' (at most every
+    fsync_interval_ms) or 'shutdown' (only when the writer is closed).
+    """
+    _STOP = object()
+
+    def __init__(self, storage, max_queue=WRITER_QUEUE_SIZE, batch_size=WRITER_BATCH_SIZE,
+                 put_timeout=WRITER_PUT_TIMEOUT, fsync_policy=WRITER_FSYNC,
+                 fsync_interval_ms=WRITER_FSYNC_INTERVAL_MS):
+        if fsync_policy not in ('always', 'interval', 'shutdown'):
+            raise ValueError(f"Unknown fsync policy: {fsync_policy}")
+        self.storage = storage
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self._process = PerProcess(self._start)
+        self._thread = None
+        self._queue = None
+        self._pending = 0
+        self._room = None
+        self._dirty = set()
+        self._last_fsync = time.monotonic()
+        atexit.register(self.close)
+
+    def _start(self):
+        # Capacity is counted in choices by _pending; the queue itself holds whole batches
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._room = threading.Condition()
+        self._dirty = set()
+        self._thread = threading.Thread(target=self._run, name='game-log-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, ref, choice_data, timeout=None):
+        """Queue a choice for appending; see submit_many"""
+        return self.submit_many(ref, [choice_data], timeout)
+
+    def submit_many(self, ref, choices, timeout=None):
+        """Queue choices for appending, all or none, waiting up to timeout (default
+        put_timeout) in total for room; returns False if they had to be dropped"""
+        self._process.ensure()
+        n = len(choices)
+        deadline = time.monotonic() + (self.put_timeout if timeout is None else timeout)
+        with self._room:
+            while self._pending + n > self.max_queue:
+                remaining = deadline - time.monotonic()
+                if n > self.max_queue or remaining <= 0:
+                    self.dropped += n
+                    return False
+                self._room.wait(remaining)
+            self._pending += n
+        self._queue.put((ref, list(choices)))
+        return True
+
+    def has_room(self, n):
+        """Whether n more choices would fit right now"""
+        return self.queue_depth + n <= self.max_queue
+
+    @property
+    def queue_depth(self):
+        return self._pending if self._process.started else 0
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue': self.max_queue,
+            'written': self.written,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'fsync_policy': self.fsync_policy,
+        }
+
+    def flush(self):
+        """Block until every queued choice has been written"""
+        if self._process.started:
+            self._queue.join()
+
+    def close(self):
+        """Write out everything still queued, fsync, and stop the thread"""
+        if not self._process.started or not self._thread.is_alive():
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def _run(self):
+        timeout = self.fsync_interval if self.fsync_policy == 'interval' else None
+        while True:
+            try:
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                self._fsync_dirty()
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is self._STOP for item in batch)
+            items = [item for item in batch if item is not self._STOP]
+            self._write_batch(items)
+            with self._room:
+                self._pending -= sum(len(choices) for _, choices in items)
+                self._room.notify_all()
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._fsync_dirty()
+                return
+
+    def _write_batch(self, batch):
+        # Group by game so each one gets a single append per batch
+        grouped = {}
+        for ref, choices in batch:
+            grouped.setdefault(ref, []).extend(choices)
+        for ref, choices in grouped.items():
+            try:
+                with metrics.span('log_append'):
+                    self.storage.append_choices(ref, choices, fsync=self.fsync_policy == 'always')
+                self.written += len(choices)
+                if self.fsync_policy != 'always':
+                    self._dirty.add(ref)
+            except Exception as e:
+                self.errors += len(choices)
+                logger.error("Error writing %d choices to %s: %s", len(choices), ref, e)
+        if self.fsync_policy == 'interval' and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync_dirty()
+
+    def _fsync_dirty(self):
+        dirty, self._dirty = self._dirty, set()
+        if dirty:
+            try:
+                with metrics.span('log_sync'):
+                    self.storage.sync(dirty)
+            except Exception as e:
+                logger.error("Error syncing game logs: %s", e)
+        self._last_fsync = time.monotonic()
+
 
 class GameLogger:
-    def __init__(self):
+    def __init__(self, logs_dir=None, log_format=LOG_FORMAT, writer_mode=WRITER_MODE, backend=LOG_BACKEND):
         # Use same directory creation pattern
-        self.logs_dir = os.path.join(os.path.dirname(__file__), 'logs')
-        os.makedirs(self.logs_dir, exist_ok=True)
-        print(f"GameLogger initialized. Logs directory: {self.logs_dir}", flush=True)
+        self.logs_dir = logs_dir or GAME_LOGS_DIR
+        self.storage = make_storage(backend, self.logs_dir, log_format)
+        self.writer = BackgroundWriter(self.storage) if writer_mode == 'async' else None
+        logger.info("GameLogger initialized. Storage: %s", self.storage.status())
 
-    def create_game_log(self):
-        """Create a new game log file using proven pattern"""
+    def create_game_log(self, metadata=None, start_time=None):
+        """Create a new game log and return (game_id, log reference)"""
         try:
-            # Generate unique filename
             game_id = str(uuid.uuid4())
-            filename = f"game_{game_id}.json"
-            filepath = os.path.join(self.logs_dir, filename)
-            
+
             # Initial game structure
             game_data = {
                 'game_id': game_id,
-                'start_time': datetime.utcnow().isoformat(),
+                'start_time': start_time or datetime.utcnow().isoformat(),
                 'choices': [],
                 'metadata': {
                     'file_created': datetime.utcnow().isoformat()
                 }
             }
-            
-            # Use the working file writing pattern
-            with open(filepath, 'w') as f:
-                json.dump(game_data, f, indent=2)
-                
-            print(f"Created game log: {filepath}", flush=True)
-            return game_id, filepath
-                
+            if metadata:
+                game_data['metadata'].update(metadata)
+            with metrics.span('log_create'):
+                ref = self.storage.create_game(game_data)
+            study_stats.game_started(game_data['metadata'])
+
+            logger.debug("Created game log: %s", ref)
+            return game_id, ref
+
         except Exception as e:
-            print(f"Error creating game log: {str(e)}", flush=True)
+            logger.exception("Error creating game log: %s", e)
             raise
 
-    def log_choice(self, filepath, choice_data):
-        """Log a choice to the game file"""
+    def game_ref(self, game_id, start_time):
+        """Log reference of a game, from the game_id and start_time it was created with"""
+        return self.storage.game_ref(game_id, start_time)
+
+    def final_choice(self, ref):
+        """The game's logged final_choice event, or None while it has none"""
+        # Choices this process has queued count too; another worker's queue is at most a batch behind
+        self.flush()
+        try:
+            game = self.storage.read_game(ref)
+        except (OSError, KeyError, ValueError):
+            return None
+        return next((c for c in game.get('choices', []) if c.get('type') == 'final_choice'), None)
+
+    def log_choice(self, ref, choice_data):
+        """Log a choice to the game log"""
         try:
-            # Read current game data
-            with open(filepath, 'r') as f:
-                game_data = json.load(f)
-            
             # Add timestamp if not present
             if 'timestamp' not in choice_data:
                 choice_data['timestamp'] = datetime.utcnow().isoformat()
-            
-            # Append new choice
-            game_data['choices'].append(choice_data)
-            
-            # Write updated data
-            with open(filepath, 'w') as f:
-                json.dump(game_data, f, indent=2)
-                
-            print(f"Logged choice to: {filepath}", flush=True)
+
+            if self.writer is not None:
+                if not self.writer.submit(ref, choice_data):
+                    return False
+            else:
+                with metrics.span('log_append'):
+                    self.storage.append_choices(ref, [choice_data])
+                logger.debug("Logged choice to: %s", ref)
+            study_stats.choices_logged([choice_data])
             return True
-                
+
         except Exception as e:
-            print(f"Error logging choice: {str(e)}", flush=True)
-            return False
\ No newline at end of file
+            logger.exception("Error logging choice: %s", e)
+            return False
+
+    def log_choices(self, ref, choices, timeout=None):
+        """Log a batch of choices to the game log; returns how many were accepted (all or none).
+
+        timeout is how long the async writer may wait for queue space for the
+        whole batch (default: the writer's put_timeout; 0: never block).
+        """
+        try:
+            now = datetime.utcnow().isoformat()
+            for choice_data in choices:
+                choice_data.setdefault('timestamp', now)
+
+            if self.writer is not None:
+                accepted = choices if self.writer.submit_many(ref, choices, timeout) else []
+            else:
+                with metrics.span('log_append'):
+                    self.storage.append_choices(ref, choices)
+                logger.debug("Logged %d choices to: %s", len(choices), ref)
+                accepted = choices
+            study_stats.choices_logged(accepted)
+            return len(accepted)
+
+        except Exception as e:
+            logger.exception("Error logging choices: %s", e)
+            return 0
+
+    def flush(self):
+        """Wait for queued choices to reach the log storage"""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def writer_stats(self):
+        """Queue depth and drop counters of the background writer"""
+        if self.writer is None:
+            return {'mode': 'sync'}
+        return dict(self.writer.stats(), mode='async')
+
+    def read_game_log(self, ref):
+        """Rebuild the nested game document ({'game_id', 'start_time', 'choices', ...})"""
+        return self.storage.read_game(ref)
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""Bayesian ideal-observer scoring of logged games.
+
+For every completed game, the posterior over which quadrant is biased is
+computed from the colours the participant actually revealed, and compared with
+their final_choice. The likelihood models the ratio validation VSTtask applies
+when generating rounds (truncated binomials), not just the raw red rates.
+Results are kept in a columnar .npz file keyed by game_id; each run reads
+only completed games (from the storage index) that are not in it yet. Games
+that cannot be scored are recorded there too, so they are not read again:
+
+    python -m utils.GameScoring [--output logs/observer_scores.npz]
+"""
+import os
+import argparse
+import numpy as np
+from .config import LOGS_DIR, GAME_CONFIG
+from .LogStorage import make_storage
+from .MonteCarlo import truncated_log_likelihood_matrix, posterior
+from .VSTtask import VSTtask, ColorMatrix
+
+SCORES_FILE = os.path.join(LOGS_DIR, 'observer_scores.npz')
+MAX_QUADRANTS = 4
+
+COLUMNS = ('game_id', 'n_quadrants', 'red', 'green', 'posterior', 'observer_choice',
+           'chosen_quadrant', 'biased_quadrant', 'participant_correct', 'observer_correct')
+# Completed games that could not be scored (bad final choice, impossible reveal counts)
+SKIPPED = 'skipped_game_id'
+
+
+def load_scores(path=SCORES_FILE):
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        scores = {name: data[name] for name in COLUMNS}
+        scores[SKIPPED] = data[SKIPPED] if SKIPPED in data.files else np.zeros(0, dtype='U36')
+    return scores
+
+
+def _quadrant(value, n_quadrants):
+    """value as a quadrant index of this game, or None for anything else a client might send"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        quadrant = int(value)
+    except ValueError:
+        return None
+    return quadrant if 0 <= quadrant < n_quadrants else None
+
+
+def collect_games(games):
+    """Flatten completed games into per-game and per-reveal columns.
+
+    Returns (game_ids, n_quadrants, n_samples, chosen, biased, reveal_game,
+    reveal_quadrant, reveal_red, skipped) so that the counting can be done
+    with array operations. Reveals with an unknown quadrant or colour are
+    ignored; games whose shape or biased quadrant is unusable go to skipped.
+    """
+    game_ids, n_quadrants, n_samples, chosen, biased = [], [], [], [], []
+    reveal_game, reveal_quadrant, reveal_red = [], [], []
+    skipped = []
+    for game in games:
+        final = next((c for c in game.get('choices', []) if c.get('type') == 'final_choice'), None)
+        if final is None:
+            # Still in progress; picked up by a later run
+            continue
+        metadata = game.get('metadata', {})
+        try:
+            quadrants = int(metadata.get('n_quadrants', GAME_CONFIG['n_quadrants']))
+            samples = (int(metadata.get('n_rounds', GAME_CONFIG['n_rounds'])) *
+                       int(metadata.get('n_queues', GAME_CONFIG['n_queues'])))
+        except (TypeError, ValueError):
+            quadrants, samples = 0, 0
+        biased_quadrant = _quadrant(final.get('biased_quadrant', metadata.get('biased_quadrant')), quadrants)
+        if not 0 < quadrants <= MAX_QUADRANTS or samples <= 0 or biased_quadrant is None:
+            skipped.append(game['game_id'])
+            continue
+        index = len(game_ids)
+        game_ids.append(game['game_id'])
+        n_quadrants.append(quadrants)
+        n_samples.append(samples)
+        chosen_quadrant = _quadrant(final.get('chosen_quadrant'), quadrants)
+        chosen.append(-1 if chosen_quadrant is None else chosen_quadrant)
+        biased.append(biased_quadrant)
+        for choice in game['choices']:
+            quadrant = _quadrant(choice.get('quadrant'), quadrants)
+            if quadrant is not None and choice.get('color') in ColorMatrix.COLORS:
+                reveal_game.append(index)
+                reveal_quadrant.append(quadrant)
+                reveal_red.append(choice['color'] == 'RED')
+    return game_ids, n_quadrants, n_samples, chosen, biased, reveal_game, reveal_quadrant, reveal_red, skipped
+
+
+def score_games(games, p_biased=VSTtask.BIASED_RED_P, p_unbiased=VSTtask.UNBIASED_RED_P):
+    """Score a batch of game documents; returns (column dict (see COLUMNS), skipped game_ids)"""
+    (game_ids, n_quadrants, n_samples, chosen, biased,
+     reveal_game, reveal_quadrant, reveal_red, skipped) = collect_games(games)
+    n_games = len(game_ids)
+    n_quadrants = np.asarray(n_quadrants, dtype=np.int8)
+    n_samples = np.asarray(n_samples, dtype=np.int64)
+    reveal_game = np.asarray(reveal_game, dtype=np.int64)
+    reveal_quadrant = np.asarray(reveal_quadrant, dtype=np.int64)
+    reveal_red = np.asarray(reveal_red, dtype=bool)
+
+    red = np.zeros((n_games, MAX_QUADRANTS), dtype=np.int32)
+    green = np.zeros((n_games, MAX_QUADRANTS), dtype=np.int32)
+    np.add.at(red, (reveal_game[reveal_red], reveal_quadrant[reveal_red]), 1)
+    np.add.at(green, (reveal_game[~reveal_red], reveal_quadrant[~reveal_red]), 1)
+
+    # More reveals of a quadrant than it has draws means a replayed or forged log
+    usable = ((red + green) <= n_samples[:, None]).all(axis=1)
+    log_lik = np.full((n_games, MAX_QUADRANTS), -np.inf)
+    if usable.any():
+        log_lik[usable] = truncated_log_likelihood_matrix(red[usable], green[usable], n_samples[usable],
+                                                          p_biased, p_unbiased)
+    # Quadrants a game did not have get zero prior mass
+    log_lik[np.arange(MAX_QUADRANTS)[None, :] >= n_quadrants[:, None]] = -np.inf
+    # ...and reveals the validated rounds could never have produced leave no hypothesis at all
+    usable &= np.isfinite(log_lik).any(axis=1)
+    skipped += [game_id for game_id, ok in zip(game_ids, usable) if not ok]
+
+    keep = np.flatnonzero(usable)
+    post = posterior(log_lik[keep]) if len(keep) else np.zeros((0, MAX_QUADRANTS))
+    chosen = np.asarray(chosen, dtype=np.int8)[keep]
+    biased = np.asarray(biased, dtype=np.int8)[keep]
+    observer_choice = post.argmax(axis=1).astype(np.int8)
+    return {
+        'game_id': np.asarray(game_ids, dtype='U36')[keep],
+        'n_quadrants': n_quadrants[keep],
+        'red': red[keep],
+        'green': green[keep],
+        'posterior': post,
+        'observer_choice': observer_choice,
+        'chosen_quadrant': chosen,
+        'biased_quadrant': biased,
+        'participant_correct': chosen == biased,
+        'observer_correct': observer_choice == biased,
+    }, skipped
+
+
+def update_scores(storage, path=SCORES_FILE):
+    """Score completed games not yet in the scores file and append them; returns the number added"""
+    existing = load_scores(path)
+    seen = set()
+    if existing is not None:
+        seen = set(existing['game_id'].tolist()) | set(existing[SKIPPED].tolist())
+    # The index knows which games are finished, so in-progress ones are never read
+    refs = [summary['ref'] for summary in storage.select_games(completed=True) if summary['game_id'] not in seen]
+    new, skipped = score_games(storage.read_game(ref) for ref in refs)
+    added = len(new['game_id'])
+    if not added and not skipped:
+        return 0
+    new[SKIPPED] = np.asarray(skipped, dtype='U36')
+    if existing is not None:
+        new = {name: np.concatenate([existing[name], new[name]]) for name in COLUMNS + (SKIPPED,)}
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **new)
+    os.replace(tmp_path, path)
+    return added
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ideal-observer posteriors for completed games')
+    parser.add_argument('--output', default=SCORES_FILE, help='scores file (.npz) to update')
+    args = parser.parse_args()
+    added = update_scores(make_storage(), args.output)
+    scores = load_scores(args.output)
+    total = 0 if scores is None else len(scores['game_id'])
+    skipped = 0 if scores is None else len(scores[SKIPPED])
+    print(f"Scored {added} new games ({total} total, {skipped} unscorable) -> {args.output}")
+    if total:
+        print(f"Participant accuracy: {scores['participant_correct'].mean():.3f}, "
+              f"observer accuracy: {scores['observer_correct'].mean():.3f}")
\ No newline at end of file
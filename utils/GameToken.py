@@ -0,0 +1,64 @@
+import hmac
+import uuid
+import hashlib
+from datetime import datetime
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+
+class GameTokens:
+    """Signed, self-contained game state for the stateless mode.
+
+    A token carries the game_id, the game's start time, its shape and the
+    participant's progress ({'game_id', 'start_time', 'game': {n_rounds,
+    n_quadrants, n_queues, current_round, final_choice, seed}}) packed into a
+    short list, signed and timestamped with the app's secret key, so any
+    worker can verify it without shared state. The token is readable by the
+    client, so it holds no server paths (the log reference is rebuilt from
+    game_id and start_time) and the seed, which decides the biased quadrant,
+    is masked with an HMAC of the game_id.
+    """
+    COOKIE = 'trt_game'
+    FIELDS = ('n_rounds', 'n_quadrants', 'n_queues', 'current_round', 'final_choice')
+    SEED_BITS = 63
+
+    def __init__(self, secret_key, max_age):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='trt-game-v2')
+        self.secret_key = secret_key.encode() if isinstance(secret_key, str) else secret_key
+        self.max_age = max_age
+
+    def _seed_mask(self, game_id):
+        digest = hmac.new(self.secret_key, f'seed:{game_id}'.encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:8], 'big') & ((1 << self.SEED_BITS) - 1)
+
+    def dumps(self, state):
+        game, game_id = state['game'], state['game_id']
+        return self.serializer.dumps([game_id, state['start_time']] + [game.get(f) for f in self.FIELDS] +
+                                     [game['seed'] ^ self._seed_mask(game_id)])
+
+    def loads(self, token):
+        """The state in a valid, unexpired token, or None"""
+        if not token:
+            return None
+        try:
+            values = self.serializer.loads(token, max_age=self.max_age)
+        except BadSignature:
+            return None
+        if not isinstance(values, list) or len(values) != 3 + len(self.FIELDS):
+            return None
+        game_id, start_time, sealed_seed = values[0], values[1], values[-1]
+        try:
+            # Both end up in a storage reference, so only the forms the server issues are accepted
+            if str(uuid.UUID(game_id)) != game_id:
+                return None
+            datetime.fromisoformat(start_time)
+        except (TypeError, ValueError, AttributeError):
+            return None
+        if not isinstance(sealed_seed, int):
+            return None
+        game = dict(zip(self.FIELDS, values[2:-1]), seed=sealed_seed ^ self._seed_mask(game_id))
+        return {'game_id': game_id, 'start_time': start_time, 'game': game}
+
+    def set_cookie(self, response, state):
+        response.set_cookie(self.COOKIE, self.dumps(state), max_age=self.max_age,
+                            httponly=True, samesite='Lax')
+        return response
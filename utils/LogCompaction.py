@@ -0,0 +1,21 @@
+"""Compaction job for the 'sharded' game log layout.
+
+Packs completed games whose files have not been written to for
+--older-than hours into the compressed per-day segments and removes the
+files (and emptied shard directories). Safe to run while the app is
+serving, e.g. hourly from cron:
+
+    python -m utils.LogCompaction --older-than 24
+"""
+import argparse
+from .config import GAME_LOGS_DIR, COMPACT_AFTER_HOURS
+from .LogStorage import ShardedStorage
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact completed game logs into compressed segments')
+    parser.add_argument('--logs-dir', default=GAME_LOGS_DIR, help='sharded game log directory')
+    parser.add_argument('--older-than', type=float, default=COMPACT_AFTER_HOURS,
+                        help='hours since a completed game was last written')
+    args = parser.parse_args()
+    compacted = ShardedStorage(args.logs_dir).compact(args.older_than)
+    print(f"Compacted {compacted} game logs in {args.logs_dir}", flush=True)
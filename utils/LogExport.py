@@ -0,0 +1,77 @@
+"""Streaming export of game logs as NDJSON (one game per line) or CSV (one choice per row).
+
+Games are selected through the storage's summary index, so filters on
+start_time, completion and biased quadrant never open non-matching logs, and
+only one game is held in memory at a time. Also served by the /export route.
+
+    python -m utils.LogExport --format csv --completed true --output games.csv
+"""
+import io
+import csv
+import sys
+import json
+import argparse
+from .LogStorage import make_storage
+
+CSV_COLUMNS = ['game_id', 'start_time', 'completed', 'biased_quadrant', 'type', 'round', 'quadrant',
+               'choice', 'color', 'chosen_quadrant', 'correct', 'score', 'reaction_time_ms',
+               'client_timestamp', 'sent_at', 'timestamp']
+
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def parse_filters(args):
+    """Build select_games() keyword filters from string options (query args or CLI)"""
+    filters = {}
+    if args.get('start_from'):
+        filters['start_from'] = args['start_from']
+    if args.get('start_to'):
+        filters['start_to'] = args['start_to']
+    if args.get('completed') not in (None, ''):
+        filters['completed'] = str(args['completed']).lower() in ('1', 'true', 'yes')
+    if args.get('biased_quadrant') not in (None, ''):
+        filters['biased_quadrant'] = int(args['biased_quadrant'])
+    return filters
+
+
+def _csv_line(row):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue()
+
+
+def export_games(storage, fmt='ndjson', **filters):
+    """Yield the export one chunk (game or row) at a time"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'csv':
+        yield _csv_line(CSV_COLUMNS)
+    for summary in storage.select_games(**filters):
+        game = storage.read_game(summary['ref'])
+        if fmt == 'ndjson':
+            yield json.dumps(game, separators=(',', ':')) + '\n'
+            continue
+        for choice in game.get('choices', []):
+            row = dict(choice, game_id=summary['game_id'], start_time=summary['start_time'],
+                       completed=summary['completed'], biased_quadrant=summary['biased_quadrant'])
+            row.setdefault('type', 'choice')
+            yield _csv_line([row.get(column, '') for column in CSV_COLUMNS])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export game logs as NDJSON or CSV')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--start-from', help='ISO timestamp (inclusive)')
+    parser.add_argument('--start-to', help='ISO timestamp (exclusive)')
+    parser.add_argument('--completed', choices=['true', 'false'])
+    parser.add_argument('--biased-quadrant', type=int)
+    parser.add_argument('--output', help='file to write (default: stdout)')
+    args = parser.parse_args()
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for chunk in export_games(make_storage(), args.format, **parse_filters(vars(args))):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
\ No newline at end of file
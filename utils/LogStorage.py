@@ -0,0 +1,721 @@
+import os
+import gzip
+import json
+import glob
+import time
+import fcntl
+import argparse
+import itertools
+import threading
+from datetime import datetime
+from .config import GAME_LOGS_DIR, LOG_FORMAT, LOG_BACKEND, SQLITE_LOG_DB, COMPACT_AFTER_HOURS
+from .AppLog import get_logger
+from .SQLiteConnections import SQLiteConnections
+
+logger = get_logger('LogStorage')
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def read_log_file(filepath):
+    """Rebuild the nested game document ({'game_id', 'start_time', 'choices', ...}) from a log file"""
+    if not filepath.endswith('.jsonl'):
+        with open(filepath, 'r') as f:
+            return json.load(f)
+
+    with open(filepath, 'r') as f:
+        return parse_log_lines(f, filepath)
+
+
+def parse_log_lines(lines, source):
+    """Rebuild the game document from JSONL header/choice records"""
+    header, choices = {}, []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Torn final line from an interrupted write
+            logger.warning("Skipping unreadable line in %s", source)
+            continue
+        kind = record.pop('record', None)
+        if kind == 'header':
+            header = record
+        elif kind == 'choice':
+            choices.append(record['data'])
+    return dict(header, choices=choices)
+
+
+def document_lines(game):
+    """Serialise a game document as the JSONL records parse_log_lines reads back"""
+    header = {'record': 'header'}
+    header.update((k, v) for k, v in game.items() if k != 'choices')
+    records = [header] + [{'record': 'choice', 'data': c} for c in game.get('choices', [])]
+    return ''.join(_dumps(r) + '\n' for r in records)
+
+
+class LogStorage:
+    """Storage backend for game logs.
+
+    create_game returns a log reference (what the app keeps in the session
+    as 'log_filepath'); the other methods take that reference back.
+    """
+    name = None
+
+    def create_game(self, game_data):
+        raise NotImplementedError
+
+    def game_ref(self, game_id, start_time):
+        """The reference create_game returned for this game, worked out from its id and start time"""
+        raise NotImplementedError
+
+    def append_choices(self, ref, choices, fsync=False):
+        raise NotImplementedError
+
+    def sync(self, refs):
+        """Make previously appended choices durable"""
+
+    def read_game(self, ref):
+        raise NotImplementedError
+
+    def iter_games(self, exclude=()):
+        """Yield every stored game document whose game_id is not in exclude"""
+        raise NotImplementedError
+
+    def select_games(self, start_from=None, start_to=None, completed=None, biased_quadrant=None):
+        """Yield summaries ({'game_id', 'ref', 'start_time', 'n_choices', 'completed',
+        'biased_quadrant'}) of games matching every filter that is not None"""
+        raise NotImplementedError
+
+    def data_dir(self):
+        """Directory the backend writes into (checked by the health probe)"""
+        raise NotImplementedError
+
+    def status(self):
+        return {'backend': self.name}
+
+
+def _matches(summary, start_from, start_to, completed, biased_quadrant):
+    # ISO timestamps compare correctly as strings
+    return ((start_from is None or summary['start_time'] >= start_from) and
+            (start_to is None or summary['start_time'] < start_to) and
+            (completed is None or summary['completed'] == completed) and
+            (biased_quadrant is None or summary['biased_quadrant'] == biased_quadrant))
+
+
+def _log_entries(logs_dir, recursive=False, skip_dirs=()):
+    """Yield (path relative to logs_dir, DirEntry) for every game_* log file"""
+    with os.scandir(logs_dir) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive and entry.name not in skip_dirs:
+                    for name, sub_entry in _log_entries(entry.path, True):
+                        yield os.path.join(entry.name, name), sub_entry
+            elif entry.name.startswith('game_') and entry.name.endswith(('.json', '.jsonl')):
+                yield entry.name, entry
+
+
+class LogIndex:
+    """Persistent summary of every log file in a directory (and, if recursive, its shards).
+
+    Maps the file's path relative to the directory to game_id, start_time,
+    n_choices, completed, biased_quadrant and the byte offset up to which the
+    file has been read. refresh() only opens files whose size moved past that
+    offset, and then only reads the new lines.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def refresh(self, logs_dir, recursive=False, skip_dirs=()):
+        changed = False
+        present = set()
+        for name, entry in _log_entries(logs_dir, recursive, skip_dirs):
+            present.add(name)
+            try:
+                size = entry.stat().st_size
+            except FileNotFoundError:
+                # Removed (e.g. compacted) while we were listing
+                present.discard(name)
+                continue
+            summary = self.entries.get(name)
+            if summary is not None and summary['offset'] == size:
+                continue
+            try:
+                self.entries[name] = self._scan(entry.path, summary, size)
+                changed = True
+            except (OSError, ValueError) as e:
+                logger.warning("Could not index %s: %s", entry.path, e)
+        for name in set(self.entries) - present:
+            del self.entries[name]
+            changed = True
+        if changed:
+            self.save()
+        return self.entries
+
+    @staticmethod
+    def _summarise_choice(summary, choice):
+        summary['n_choices'] += 1
+        if choice.get('type') == 'final_choice':
+            summary['completed'] = True
+            summary['biased_quadrant'] = choice.get('biased_quadrant', summary['biased_quadrant'])
+
+    def _scan(self, filepath, summary, size):
+        if not filepath.endswith('.jsonl'):
+            # Legacy documents are rewritten in place, so rescan them whole
+            game = read_log_file(filepath)
+            summary = self._new_summary(game)
+            for choice in game.get('choices', []):
+                self._summarise_choice(summary, choice)
+            summary['offset'] = size
+            return summary
+
+        summary = dict(summary) if summary else None
+        with open(filepath, 'rb') as f:
+            f.seek(summary['offset'] if summary else 0)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Partially written line; read it on a later refresh
+                    break
+                record = json.loads(line)
+                if record.get('record') == 'header':
+                    summary = self._new_summary(record)
+                elif summary is not None and record.get('record') == 'choice':
+                    self._summarise_choice(summary, record['data'])
+                if summary is not None:
+                    summary['offset'] = f.tell()
+        if summary is None:
+            raise ValueError('no header record')
+        return summary
+
+    @staticmethod
+    def _new_summary(game):
+        return {
+            'game_id': game['game_id'],
+            'start_time': game.get('start_time', ''),
+            'n_choices': 0,
+            'completed': False,
+            'biased_quadrant': game.get('metadata', {}).get('biased_quadrant'),
+            'offset': 0,
+        }
+
+    def save(self):
+        # Several workers may refresh at once; each replaces the file atomically
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+
+class JsonFileStorage(LogStorage):
+    """One file per game: append-only .jsonl, or the legacy pretty-printed .json"""
+    name = 'json'
+
+    def __init__(self, logs_dir, log_format=LOG_FORMAT):
+        self.logs_dir = logs_dir
+        self.log_format = log_format
+        os.makedirs(self.logs_dir, exist_ok=True)
+        self.index = LogIndex(os.path.join(self.logs_dir, 'index.json'))
+
+    def game_ref(self, game_id, start_time):
+        return os.path.join(self.logs_dir, f"game_{game_id}.{self.log_format}")
+
+    def game_path(self, game_data):
+        return self.game_ref(game_data['game_id'], game_data['start_time'])
+
+    def create_game(self, game_data):
+        filepath = self.game_path(game_data)
+        if self.log_format == 'jsonl':
+            # Header record; choices are appended as one line each
+            header = {'record': 'header'}
+            header.update((k, v) for k, v in game_data.items() if k != 'choices')
+            self._append_lines(filepath, [header])
+        else:
+            # Use the working file writing pattern
+            with open(filepath, 'w') as f:
+                json.dump(game_data, f, indent=2)
+        return filepath
+
+    def append_choices(self, ref, choices, fsync=False):
+        if ref.endswith('.jsonl'):
+            # Constant cost per choice: a single appended line
+            self._append_lines(ref, [{'record': 'choice', 'data': c} for c in choices], fsync)
+            return
+
+        # Read current game data
+        with open(ref, 'r') as f:
+            game_data = json.load(f)
+
+        # Append new choices
+        game_data['choices'].extend(choices)
+
+        # Write updated data
+        with open(ref, 'w') as f:
+            json.dump(game_data, f, indent=2)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _append_lines(filepath, records, fsync=False):
+        """Append records as JSON lines with a single write in append mode.
+
+        O_APPEND makes each write land at the current end of file, so
+        concurrent writers for the same game cannot overwrite each other.
+        """
+        payload = ''.join(_dumps(r) + '\n' for r in records)
+        with open(filepath, 'a') as f:
+            f.write(payload)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def sync(self, refs):
+        for filepath in refs:
+            fd = os.open(filepath, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def read_game(self, ref):
+        return read_log_file(ref)
+
+    def log_files(self):
+        return sorted(glob.glob(os.path.join(self.logs_dir, 'game_*.json')) +
+                      glob.glob(os.path.join(self.logs_dir, 'game_*.jsonl')))
+
+    @staticmethod
+    def game_id_from_path(filepath):
+        return os.path.basename(filepath).split('.', 1)[0][len('game_'):]
+
+    def iter_games(self, exclude=()):
+        for filepath in self.log_files():
+            # The game_id is in the file name, so excluded games are never opened
+            if exclude and self.game_id_from_path(filepath) in exclude:
+                continue
+            try:
+                yield read_log_file(filepath)
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping unreadable game log %s: %s", filepath, e)
+
+    def select_games(self, start_from=None, start_to=None, completed=None, biased_quadrant=None):
+        entries = self.index.refresh(self.logs_dir)
+        for name, summary in sorted(entries.items(), key=lambda item: item[1]['start_time']):
+            if _matches(summary, start_from, start_to, completed, biased_quadrant):
+                yield dict(summary, ref=os.path.join(self.logs_dir, name))
+
+    def data_dir(self):
+        return self.logs_dir
+
+    def status(self):
+        return {
+            'backend': self.name,
+            'logs_dir': self.logs_dir,
+            'format': self.log_format,
+            'writable': os.access(self.logs_dir, os.W_OK),
+        }
+
+
+class SegmentIndex:
+    """Where each compacted game lives: game_id -> segment file, byte offset and length.
+
+    Every segment '<day>.jsonl.gz' has a sidecar '<day>.idx' holding one JSON
+    line per game (location plus the select_games summary), appended only
+    after the game's gzip member is on disk. refresh() reads just the lines
+    added since the previous call.
+    """
+
+    def __init__(self, segments_dir):
+        self.segments_dir = segments_dir
+        self.entries = {}
+        self._offsets = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            with os.scandir(self.segments_dir) as it:
+                idx_files = [entry for entry in it if entry.name.endswith('.idx')]
+            for entry in idx_files:
+                offset = self._offsets.get(entry.name, 0)
+                if entry.stat().st_size == offset:
+                    continue
+                with open(entry.path, 'rb') as f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            # Still being appended; read it on a later refresh
+                            break
+                        record = json.loads(line)
+                        self.entries[record['game_id']] = record
+                        offset = f.tell()
+                self._offsets[entry.name] = offset
+        return self.entries
+
+    def lookup(self, game_id):
+        entry = self.entries.get(game_id)
+        if entry is None:
+            entry = self.refresh().get(game_id)
+        return entry
+
+
+class ShardedStorage(JsonFileStorage):
+    """Append-only .jsonl logs sharded as <day>/<game_id prefix>/game_<id>.jsonl.
+
+    compact() packs completed games that have not been written to for a
+    while into one gzip member each, appended to the day's segment in
+    'segments/', and removes their files, so the hot tree only holds recent
+    games. Flat game_* files left by the 'json' backend are read and
+    compacted as well. select_games returns file paths as references for hot
+    games and game_ids for compacted ones; read_game takes either, and falls
+    back to the segments when a hot file has been compacted away.
+    """
+    name = 'sharded'
+    SEGMENTS_DIR = 'segments'
+
+    def __init__(self, logs_dir, log_format='jsonl'):
+        if log_format != 'jsonl':
+            raise ValueError("The sharded layout only stores .jsonl logs")
+        super().__init__(logs_dir, log_format)
+        self.segments_dir = os.path.join(self.logs_dir, self.SEGMENTS_DIR)
+        os.makedirs(self.segments_dir, exist_ok=True)
+        self.segments = SegmentIndex(self.segments_dir)
+
+    def game_ref(self, game_id, start_time):
+        return os.path.join(self.logs_dir, start_time[:10], game_id[:2], f"game_{game_id}.jsonl")
+
+    def game_path(self, game_data):
+        filepath = self.game_ref(game_data['game_id'], game_data['start_time'])
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        return filepath
+
+    def read_game(self, ref):
+        if ref.endswith(('.json', '.jsonl')):
+            try:
+                return read_log_file(ref)
+            except FileNotFoundError:
+                ref = self.game_id_from_path(ref)
+        return self.read_compacted(ref)
+
+    def read_compacted(self, game_id):
+        entry = self.segments.lookup(game_id)
+        if entry is None:
+            raise KeyError(f"No game {game_id} in {self.logs_dir}")
+        segment_path = os.path.join(self.segments_dir, entry['segment'])
+        with open(segment_path, 'rb') as f:
+            f.seek(entry['offset'])
+            data = gzip.decompress(f.read(entry['length']))
+        return parse_log_lines(data.decode().splitlines(), segment_path)
+
+    def _hot_entries(self):
+        return self.index.refresh(self.logs_dir, recursive=True, skip_dirs=(self.SEGMENTS_DIR,))
+
+    def log_files(self):
+        return sorted(os.path.join(self.logs_dir, name)
+                      for name, _ in _log_entries(self.logs_dir, True, (self.SEGMENTS_DIR,)))
+
+    def iter_games(self, exclude=()):
+        seen = set(exclude)
+        for filepath in self.log_files():
+            if self.game_id_from_path(filepath) in seen:
+                continue
+            try:
+                game = read_log_file(filepath)
+            except FileNotFoundError:
+                # Compacted while we were listing; yielded from its segment below
+                continue
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping unreadable game log %s: %s", filepath, e)
+                continue
+            seen.add(game.get('game_id'))
+            yield game
+        entries = sorted(self.segments.refresh().values(), key=lambda e: (e['segment'], e['offset']))
+        for entry in entries:
+            if entry['game_id'] not in seen:
+                yield self.read_compacted(entry['game_id'])
+
+    def select_games(self, start_from=None, start_to=None, completed=None, biased_quadrant=None):
+        summaries = {game_id: dict(entry, ref=game_id) for game_id, entry in self.segments.refresh().items()}
+        for name, summary in self._hot_entries().items():
+            summaries[summary['game_id']] = dict(summary, ref=os.path.join(self.logs_dir, name))
+        for summary in sorted(summaries.values(), key=lambda s: s['start_time']):
+            if _matches(summary, start_from, start_to, completed, biased_quadrant):
+                yield summary
+
+    def compact(self, older_than_hours=COMPACT_AFTER_HOURS):
+        """Move completed games untouched for older_than_hours into segments; returns how many moved"""
+        cutoff = time.time() - older_than_hours * 3600
+        compacted = 0
+        with open(os.path.join(self.segments_dir, '.compact.lock'), 'a') as lock:
+            # One compactor at a time; readers and writers never take this lock
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                packed = set(self.segments.refresh())
+                by_day = {}
+                for name, summary in self._hot_entries().items():
+                    if not summary['completed']:
+                        continue
+                    filepath = os.path.join(self.logs_dir, name)
+                    try:
+                        if os.stat(filepath).st_mtime > cutoff:
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    day = summary['start_time'][:10] or 'undated'
+                    by_day.setdefault(day, []).append((filepath, summary))
+                for day, games in sorted(by_day.items()):
+                    compacted += self._compact_day(day, games, packed)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._hot_entries()
+        self._prune_empty_shards()
+        logger.info("Compacted %d game logs into %s", compacted, self.segments_dir)
+        return compacted
+
+    def _compact_day(self, day, games, packed):
+        segment = f"{day}.jsonl.gz"
+        records = []
+        # Only files whose game is safely in a segment are removed; unreadable ones stay for a later run
+        removable = []
+        with open(os.path.join(self.segments_dir, segment), 'ab') as f:
+            offset = os.fstat(f.fileno()).st_size
+            for filepath, summary in games:
+                if summary['game_id'] in packed:
+                    # Packed by an earlier run that stopped before removing the file
+                    removable.append(filepath)
+                    continue
+                try:
+                    game = read_log_file(filepath)
+                except (OSError, ValueError) as e:
+                    logger.warning("Not compacting unreadable game log %s: %s", filepath, e)
+                    continue
+                # One gzip member per game: seekable by offset, and the segment still gunzips as a whole
+                member = gzip.compress(document_lines(game).encode(), mtime=0)
+                f.write(member)
+                records.append({
+                    'game_id': summary['game_id'],
+                    'segment': segment,
+                    'offset': offset,
+                    'length': len(member),
+                    'start_time': summary['start_time'],
+                    'n_choices': summary['n_choices'],
+                    'completed': summary['completed'],
+                    'biased_quadrant': summary['biased_quadrant'],
+                })
+                offset += len(member)
+                removable.append(filepath)
+            f.flush()
+            os.fsync(f.fileno())
+        # The index lines go in only once the data is durable
+        self._append_lines(os.path.join(self.segments_dir, f"{day}.idx"), records, fsync=True)
+        for filepath in removable:
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+        return len(records)
+
+    def _prune_empty_shards(self):
+        # Today's shards are left alone so create_game never races a removal
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+        with os.scandir(self.logs_dir) as it:
+            days = [entry.path for entry in it
+                    if entry.is_dir() and entry.name != self.SEGMENTS_DIR and entry.name < today]
+        for day in days:
+            for prefix in os.listdir(day):
+                try:
+                    os.rmdir(os.path.join(day, prefix))
+                except OSError:
+                    pass
+            try:
+                os.rmdir(day)
+            except OSError:
+                pass
+
+    def status(self):
+        return dict(super().status(), segments_dir=self.segments_dir,
+                    compacted_games=len(self.segments.entries))
+
+
+class SQLiteStorage(LogStorage):
+    """Games and choices in one SQLite database in WAL mode.
+
+    Every process (and thread) opens its own connection, so gunicorn
+    workers share the database file and SQLite's locking serialises writers.
+    """
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            game_id    TEXT PRIMARY KEY,
+            start_time TEXT NOT NULL,
+            metadata   TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS choices (
+            id        INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_id   TEXT NOT NULL REFERENCES games(game_id),
+            timestamp TEXT,
+            type      TEXT,
+            data      TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_games_start_time ON games(start_time);
+        CREATE INDEX IF NOT EXISTS idx_choices_game_id ON choices(game_id, id);
+        CREATE INDEX IF NOT EXISTS idx_choices_timestamp ON choices(timestamp);
+    """
+
+    def __init__(self, db_path=SQLITE_LOG_DB, busy_timeout=10.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._connections = SQLiteConnections(db_path, busy_timeout)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        return self._connections.get()
+
+    def create_game(self, game_data):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO games (game_id, start_time, metadata) VALUES (?, ?, ?)',
+                (game_data['game_id'], game_data['start_time'], _dumps(game_data.get('metadata', {})))
+            )
+        return game_data['game_id']
+
+    def game_ref(self, game_id, start_time):
+        return game_id
+
+    def append_choices(self, ref, choices, fsync=False):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO choices (game_id, timestamp, type, data) VALUES (?, ?, ?, ?)',
+                [(ref, c.get('timestamp'), c.get('type', 'choice'), _dumps(c)) for c in choices]
+            )
+        if fsync:
+            self.sync([ref])
+
+    def sync(self, refs):
+        # With synchronous=NORMAL the WAL is fsynced at checkpoint time
+        self._connect().execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def _document(self, row, conn):
+        game_id, start_time, metadata = row
+        choices = [json.loads(data) for (data,) in conn.execute(
+            'SELECT data FROM choices WHERE game_id = ? ORDER BY id', (game_id,))]
+        return {'game_id': game_id, 'start_time': start_time,
+                'metadata': json.loads(metadata), 'choices': choices}
+
+    def read_game(self, ref):
+        conn = self._connect()
+        row = conn.execute('SELECT game_id, start_time, metadata FROM games WHERE game_id = ?',
+                           (ref,)).fetchone()
+        if row is None:
+            raise KeyError(f"No game {ref} in {self.db_path}")
+        return self._document(row, conn)
+
+    def iter_games(self, exclude=()):
+        conn = self._connect()
+        for row in conn.execute('SELECT game_id, start_time, metadata FROM games ORDER BY start_time').fetchall():
+            if row[0] not in exclude:
+                yield self._document(row, conn)
+
+    def select_games(self, start_from=None, start_to=None, completed=None, biased_quadrant=None):
+        query = '''
+            SELECT g.game_id, g.start_time,
+                   (SELECT COUNT(*) FROM choices c WHERE c.game_id = g.game_id),
+                   (SELECT data FROM choices c WHERE c.game_id = g.game_id AND c.type = 'final_choice'
+                    ORDER BY c.id LIMIT 1),
+                   g.metadata
+            FROM games g WHERE 1 = 1
+        '''
+        params = []
+        if start_from is not None:
+            query += ' AND g.start_time >= ?'
+            params.append(start_from)
+        if start_to is not None:
+            query += ' AND g.start_time < ?'
+            params.append(start_to)
+        query += ' ORDER BY g.start_time'
+        rows = self._connect().execute(query, params).fetchall()
+        for game_id, start_time, n_choices, final, metadata in rows:
+            final = json.loads(final) if final else None
+            summary = {
+                'game_id': game_id,
+                'ref': game_id,
+                'start_time': start_time,
+                'n_choices': n_choices,
+                'completed': final is not None,
+                'biased_quadrant': (final or {}).get('biased_quadrant', json.loads(metadata).get('biased_quadrant')),
+            }
+            if _matches(summary, None, None, completed, biased_quadrant):
+                yield summary
+
+    def import_games(self, games):
+        """Bulk insert game documents in one transaction; games already present are skipped"""
+        imported = 0
+        conn = self._connect()
+        with conn:
+            for game in games:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO games (game_id, start_time, metadata) VALUES (?, ?, ?)',
+                    (game['game_id'], game.get('start_time', ''), _dumps(game.get('metadata', {})))
+                )
+                if cursor.rowcount == 0:
+                    continue
+                conn.executemany(
+                    'INSERT INTO choices (game_id, timestamp, type, data) VALUES (?, ?, ?, ?)',
+                    [(game['game_id'], c.get('timestamp'), c.get('type', 'choice'), _dumps(c))
+                     for c in game.get('choices', [])]
+                )
+                imported += 1
+        return imported
+
+    def data_dir(self):
+        return os.path.dirname(self.db_path)
+
+    def status(self):
+        return {
+            'backend': self.name,
+            'db_path': self.db_path,
+            'writable': os.access(os.path.dirname(self.db_path), os.W_OK),
+        }
+
+
+def make_storage(backend=LOG_BACKEND, logs_dir=None, log_format=LOG_FORMAT):
+    if backend == 'json':
+        return JsonFileStorage(logs_dir or GAME_LOGS_DIR, log_format)
+    if backend == 'sharded':
+        return ShardedStorage(logs_dir or GAME_LOGS_DIR, log_format)
+    if backend == 'sqlite':
+        return SQLiteStorage()
+    raise ValueError(f"Unknown log backend: {backend}")
+
+
+def migrate_json_logs(source_dir, storage, batch_size=1000):
+    """One-shot import of game logs (flat or sharded files and compacted segments) into a SQLite storage"""
+    games = ShardedStorage(source_dir).iter_games()
+    imported = total = 0
+    while True:
+        batch = list(itertools.islice(games, batch_size))
+        if not batch:
+            break
+        total += len(batch)
+        imported += storage.import_games(batch)
+    print(f"Imported {imported} of {total} game logs from {source_dir}", flush=True)
+    return imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import JSON game logs into the SQLite log backend')
+    parser.add_argument('source_dir', help='game log directory (flat or sharded)')
+    parser.add_argument('--db', default=SQLITE_LOG_DB, help='SQLite database to import into')
+    args = parser.parse_args()
+    migrate_json_logs(args.source_dir, SQLiteStorage(args.db))
\ No newline at end of file
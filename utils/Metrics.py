@@ -0,0 +1,236 @@
+import os
+import mmap
+import time
+import fcntl
+import struct
+import zlib
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from .config import METRICS_FILE, METRICS_SLOTS
+from .PerProcess import PerProcess
+
+# Latency buckets in seconds, Prometheus style
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_TYPES = {
+    'trt_http_requests_total': 'counter',
+    'trt_http_request_duration_seconds': 'histogram',
+    'trt_span_duration_seconds': 'histogram',
+}
+
+
+class SharedCounters:
+    """Named float counters in an mmap'ed file shared by every worker process.
+
+    The file is a small open-addressing hash table: each slot holds a
+    null-padded UTF-8 series key and a double. Updates take an flock on the
+    file (plus a thread lock, since flock does not exclude threads of the
+    same process), so all workers add into the same numbers.
+    """
+    MAGIC = b'TRTCNT01'
+    HEADER = struct.Struct('<8sI4x')
+    KEY_SIZE = 120
+    SLOT = struct.Struct(f'<{KEY_SIZE}sd')
+
+    def __init__(self, path=METRICS_FILE, n_slots=METRICS_SLOTS):
+        self.path = path
+        self.n_slots = n_slots
+        self.size = self.HEADER.size + n_slots * self.SLOT.size
+        self._thread_lock = threading.Lock()
+        # A descriptor inherited over fork would share its flock with the parent
+        self._process = PerProcess(self._open)
+        self._fd = None
+        self._mm = None
+        self._offsets = {}
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o664)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            mm = mmap.mmap(fd, self.size)
+            magic, n_slots = self.HEADER.unpack_from(mm, 0)
+            if magic != self.MAGIC or n_slots != self.n_slots:
+                # New (or incompatible) file: start from an empty table
+                mm[:] = bytes(self.size)
+                self.HEADER.pack_into(mm, 0, self.MAGIC, self.n_slots)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd, self._mm, self._offsets = fd, mm, {}
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            self._process.ensure()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._mm
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, mm, key, claim=True):
+        """Slot offset of key, claiming an empty slot if needed (caller holds the lock).
+
+        With claim=False a missing key is not added and None is returned.
+        """
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        encoded = key.encode()[:self.KEY_SIZE]
+        start = zlib.crc32(encoded) % self.n_slots
+        for probe in range(self.n_slots):
+            offset = self.HEADER.size + ((start + probe) % self.n_slots) * self.SLOT.size
+            stored = mm[offset:offset + self.KEY_SIZE].rstrip(b'\0')
+            if not stored:
+                # Slots are never freed, so the first empty one ends the probe
+                if not claim:
+                    return None
+                self.SLOT.pack_into(mm, offset, encoded, 0.0)
+            elif stored != encoded:
+                continue
+            self._offsets[key] = offset
+            return offset
+        if not claim:
+            return None
+        raise RuntimeError(f"Metrics file {self.path} is full")
+
+    def add_many(self, increments):
+        """Add each (key, amount) pair under a single lock acquisition"""
+        with self._locked() as mm:
+            for key, amount in increments:
+                value_at = self._offset(mm, key) + self.KEY_SIZE
+                (value,) = struct.unpack_from('<d', mm, value_at)
+                struct.pack_into('<d', mm, value_at, value + amount)
+
+    def add(self, key, amount=1.0):
+        self.add_many([(key, amount)])
+
+    def set(self, key, value):
+        with self._locked() as mm:
+            struct.pack_into('<d', mm, self._offset(mm, key) + self.KEY_SIZE, value)
+
+    def clear(self):
+        """Zero every series; keys keep their slots, so offsets cached by other processes stay valid"""
+        with self._locked() as mm:
+            for slot in range(self.n_slots):
+                offset = self.HEADER.size + slot * self.SLOT.size
+                if mm[offset] != 0:
+                    struct.pack_into('<d', mm, offset + self.KEY_SIZE, 0.0)
+
+    def get(self, key, default=0.0):
+        with self._locked() as mm:
+            offset = self._offset(mm, key, claim=False)
+            if offset is None:
+                return default
+            return struct.unpack_from('<d', mm, offset + self.KEY_SIZE)[0]
+
+    def snapshot(self):
+        """All series as {key: value}"""
+        values = {}
+        with self._locked() as mm:
+            for slot in range(self.n_slots):
+                key, value = self.SLOT.unpack_from(mm, self.HEADER.size + slot * self.SLOT.size)
+                key = key.rstrip(b'\0')
+                if key:
+                    values[key.decode()] = value
+        return values
+
+
+def series(name, labels=None):
+    if not labels:
+        return name
+    # 'le' goes last so the buckets of one series sort together
+    ordered = sorted(labels.items(), key=lambda kv: (kv[0] == 'le', kv[0]))
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in ordered) + '}'
+
+
+class Metrics:
+    """Counters and latency histograms recorded into SharedCounters"""
+
+    def __init__(self, counters=None, buckets=DEFAULT_BUCKETS):
+        self.counters = counters or SharedCounters()
+        self.buckets = buckets
+
+    def inc(self, name, labels=None, amount=1.0):
+        self.counters.add(series(name, labels), amount)
+
+    def observe(self, name, value, labels=None):
+        labels = labels or {}
+        increments = [(series(f'{name}_bucket', dict(labels, le=str(b))), 1.0)
+                      for b in self.buckets if value <= b]
+        increments += [
+            (series(f'{name}_bucket', dict(labels, le='+Inf')), 1.0),
+            (series(f'{name}_sum', labels), value),
+            (series(f'{name}_count', labels), 1.0),
+        ]
+        self.counters.add_many(increments)
+
+    @contextmanager
+    def span(self, name):
+        """Time a block into trt_span_duration_seconds{span=name}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('trt_span_duration_seconds', time.perf_counter() - start, {'span': name})
+
+    def timed(self, name):
+        """Decorator form of span()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Prometheus text exposition of every series, summed over all workers"""
+        snapshot = self.counters.snapshot()
+        families = {}
+        for key, value in snapshot.items():
+            base = key.split('{', 1)[0]
+            for suffix in ('_bucket', '_sum', '_count'):
+                if base.endswith(suffix) and base[:-len(suffix)] in METRIC_TYPES:
+                    base = base[:-len(suffix)]
+                    break
+            families.setdefault(base, []).append((key, value))
+
+        lines = []
+        for family in sorted(families):
+            lines.append(f'# TYPE {family} {METRIC_TYPES.get(family, "gauge")}')
+            for key, value in sorted(families[family], key=lambda kv: _bucket_order(kv[0])):
+                lines.append(f'{key} {value:.17g}')
+        return '\n'.join(lines) + '\n'
+
+
+def _bucket_order(key):
+    # Keep buckets of one series in ascending le order
+    if 'le="' not in key:
+        return (key, 0.0)
+    prefix, le = key.rsplit('le="', 1)
+    le = le.split('"', 1)[0]
+    return (prefix, float('inf') if le == '+Inf' else float(le))
+
+
+def instrument_session_interface(interface, metrics):
+    """Time session load/save of any Flask SessionInterface"""
+    open_session, save_session = interface.open_session, interface.save_session
+
+    def timed_open(app, request):
+        with metrics.span('session_load'):
+            return open_session(app, request)
+
+    def timed_save(app, session, response):
+        with metrics.span('session_save'):
+            return save_session(app, session, response)
+
+    interface.open_session = timed_open
+    interface.save_session = timed_save
+    return interface
+
+
+metrics = Metrics()
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""Vectorized Monte Carlo simulation of VSTtask games for parameter calibration.
+
+Games are generated as boolean colour arrays (games x rounds x quadrants x queues)
+with the same colour model and validation rules as VSTtask, and summarised by
+rejection rate, red-ratio distributions of accepted games and ideal-observer
+accuracy (given all colours, or only the cues revealed per round). Run from the
+command line, e.g.
+
+    python -m utils.MonteCarlo --rounds 3 5 8 --queues 1 2 --games 1000000
+"""
+import os
+import json
+import math
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import numpy as np
+from .VSTtask import VSTtask
+
+
+def log_likelihood_matrix(red, green, p_biased=VSTtask.BIASED_RED_P, p_unbiased=VSTtask.UNBIASED_RED_P):
+    """Log-likelihood (up to a shared constant) of 'quadrant q is biased' for each game.
+
+    red and green are (games x quadrants) counts of observed colours. Under
+    hypothesis q only quadrant q's draws change probability, so each entry is
+    red_q * log(pb / pu) + green_q * log((1 - pb) / (1 - pu)).
+    """
+    red = np.asarray(red, dtype=np.float64)
+    green = np.asarray(green, dtype=np.float64)
+    return red * np.log(p_biased / p_unbiased) + green * np.log((1 - p_biased) / (1 - p_unbiased))
+
+
+@lru_cache(maxsize=None)
+def _log_window_probability(n_red, n_unseen, n_samples, p_red, low, high):
+    """log P(low <= (n_red + Binomial(n_unseen, p_red)) / n_samples <= high)"""
+    total = sum(math.comb(n_unseen, k) * p_red ** k * (1 - p_red) ** (n_unseen - k)
+                for k in range(n_unseen + 1) if low <= (n_red + k) / n_samples <= high)
+    return math.log(total) if total > 0 else -math.inf
+
+
+def truncated_log_likelihood_matrix(red, green, n_samples, p_biased=VSTtask.BIASED_RED_P,
+                                    p_unbiased=VSTtask.UNBIASED_RED_P, biased_min=VSTtask.BIASED_MIN_RATIO,
+                                    unbiased_range=VSTtask.UNBIASED_RATIO_RANGE):
+    """log_likelihood_matrix for games that passed VSTtask's ratio validation.
+
+    A game is only kept when each quadrant's red ratio over all n_samples of
+    its draws lies in its window, so every quadrant also contributes the
+    probability that its unseen draws bring the total into that window (the
+    biased window under its own hypothesis, the unbiased one otherwise). The
+    acceptance probability of the whole game is the same under every
+    hypothesis and cancels. n_samples is per game; red + green must not exceed it.
+    """
+    red = np.asarray(red, dtype=np.int64)
+    green = np.asarray(green, dtype=np.int64)
+    n_samples = np.broadcast_to(np.asarray(n_samples, dtype=np.int64).reshape(-1, 1), red.shape)
+    unseen = n_samples - red - green
+    # Few distinct (red, unseen, n_samples) cells exist, so the window terms come from a lookup
+    # table: each cell is packed into one integer (all three lie in 0..n_samples) and deduplicated
+    base = int(n_samples.max(initial=0)) + 1
+    keys, inverse = np.unique(((n_samples * base + red) * base + unseen).ravel(), return_inverse=True)
+    cells = [(int(key // base % base), int(key % base), int(key // base // base)) for key in keys]
+    table_b = np.array([_log_window_probability(*cell, p_biased, biased_min, 1.0) for cell in cells],
+                       dtype=np.float64)
+    table_u = np.array([_log_window_probability(*cell, p_unbiased, *unbiased_range) for cell in cells],
+                       dtype=np.float64)
+    inverse = inverse.reshape(red.shape)
+    window_b, window_u = table_b[inverse], table_u[inverse]
+    seen_b = red * np.log(p_biased) + green * np.log(1 - p_biased)
+    seen_u = red * np.log(p_unbiased) + green * np.log(1 - p_unbiased)
+    # Hypothesis q: quadrant q biased, every other quadrant unbiased (no subtraction, so -inf stays exact)
+    others = np.where(np.eye(red.shape[1], dtype=bool)[None, :, :], 0.0, (seen_u + window_u)[:, None, :])
+    return seen_b + window_b + others.sum(axis=2)
+
+
+def posterior(log_likelihood):
+    """Normalise a (games x quadrants) log-likelihood matrix under a uniform prior"""
+    shifted = log_likelihood - log_likelihood.max(axis=1, keepdims=True)
+    weights = np.exp(shifted)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def simulate(n_games, n_rounds, n_quadrants, n_queues, p_biased=VSTtask.BIASED_RED_P,
+             p_unbiased=VSTtask.UNBIASED_RED_P, biased_min=VSTtask.BIASED_MIN_RATIO,
+             unbiased_range=VSTtask.UNBIASED_RATIO_RANGE, reveals_per_round=None, seed=None,
+             chunk_size=200000):
+    """Simulate n_games draws and return raw tallies (mergeable across workers).
+
+    reveals_per_round limits the ideal observer to that many uniformly chosen
+    cues per round (round.html moves on after one click); None reveals all.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = n_rounds * n_queues
+    quadrants = np.arange(n_quadrants)
+    low, high = unbiased_range
+    tallies = {
+        'games': 0,
+        'accepted': 0,
+        'observer_correct': 0,
+        'biased_red_counts': np.zeros(n_samples + 1, dtype=np.int64),
+        'unbiased_red_counts': np.zeros(n_samples + 1, dtype=np.int64),
+    }
+    remaining = n_games
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        remaining -= size
+
+        biased = rng.integers(n_quadrants, size=size)
+        is_biased = quadrants[None, :] == biased[:, None]
+        p_red = np.where(is_biased, p_biased, p_unbiased)
+        colours = rng.random((size, n_rounds, n_quadrants, n_queues)) < p_red[:, None, :, None]
+
+        red = colours.sum(axis=(1, 3))
+        ratio = red / n_samples
+        valid = np.where(is_biased, ratio >= biased_min, (ratio >= low) & (ratio <= high)).all(axis=1)
+
+        red, biased, is_biased, colours = red[valid], biased[valid], is_biased[valid], colours[valid]
+        tallies['games'] += size
+        tallies['accepted'] += int(valid.sum())
+        tallies['biased_red_counts'] += np.bincount(red[is_biased], minlength=n_samples + 1)
+        tallies['unbiased_red_counts'] += np.bincount(red[~is_biased], minlength=n_samples + 1)
+
+        if reveals_per_round is None:
+            seen_red, seen_green = red, n_samples - red
+        else:
+            n_cues = n_quadrants * n_queues
+            picks = rng.random((len(biased), n_rounds, n_cues)).argsort(axis=2) < reveals_per_round
+            seen = picks.reshape(colours.shape)
+            seen_red = (colours & seen).sum(axis=(1, 3))
+            seen_green = (~colours & seen).sum(axis=(1, 3))
+
+        # Ties between equally likely quadrants are broken at random
+        log_lik = log_likelihood_matrix(seen_red, seen_green, p_biased, p_unbiased)
+        jitter = rng.random(log_lik.shape) * 1e-9
+        tallies['observer_correct'] += int(((log_lik + jitter).argmax(axis=1) == biased).sum())
+    return tallies
+
+
+def _simulate_kwargs(kwargs):
+    return simulate(**kwargs)
+
+
+def summarise(setting, tallies):
+    n_samples = setting['n_rounds'] * setting['n_queues']
+    ratios = np.arange(n_samples + 1) / n_samples
+    accepted = tallies['accepted']
+
+    def mean_ratio(counts):
+        return float((counts * ratios).sum() / max(counts.sum(), 1))
+
+    return dict(
+        setting,
+        games=tallies['games'],
+        rejection_rate=1 - tallies['accepted'] / tallies['games'],
+        observer_accuracy=tallies['observer_correct'] / accepted if accepted else float('nan'),
+        biased_ratio_mean=mean_ratio(tallies['biased_red_counts']),
+        unbiased_ratio_mean=mean_ratio(tallies['unbiased_red_counts']),
+        biased_ratio_hist={f"{r:.3f}": int(c) for r, c in zip(ratios, tallies['biased_red_counts']) if c},
+        unbiased_ratio_hist={f"{r:.3f}": int(c) for r, c in zip(ratios, tallies['unbiased_red_counts']) if c},
+    )
+
+
+def run_grid(settings, n_games, workers=None, seed=0):
+    """Simulate every setting, splitting each one's games across a process pool"""
+    workers = workers or os.cpu_count() or 1
+    seeds = np.random.SeedSequence(seed).spawn(len(settings) * workers)
+    jobs = []
+    for i, setting in enumerate(settings):
+        for w in range(workers):
+            share = n_games // workers + (1 if w < n_games % workers else 0)
+            jobs.append(dict(setting, n_games=share, seed=seeds[i * workers + w]))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_simulate_kwargs, jobs))
+
+    results = []
+    for i, setting in enumerate(settings):
+        merged = None
+        for part in parts[i * workers:(i + 1) * workers]:
+            merged = part if merged is None else {k: merged[k] + part[k] for k in merged}
+        results.append(summarise(setting, merged))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monte Carlo calibration of VSTtask parameters')
+    parser.add_argument('--games', type=int, default=1000000, help='games simulated per setting')
+    parser.add_argument('--rounds', type=int, nargs='+', default=[5])
+    parser.add_argument('--quadrants', type=int, nargs='+', default=[4])
+    parser.add_argument('--queues', type=int, nargs='+', default=[1])
+    parser.add_argument('--p-biased', type=float, nargs='+', default=[VSTtask.BIASED_RED_P])
+    parser.add_argument('--biased-min', type=float, nargs='+', default=[VSTtask.BIASED_MIN_RATIO])
+    parser.add_argument('--unbiased-range', type=float, nargs=2, default=list(VSTtask.UNBIASED_RATIO_RANGE))
+    parser.add_argument('--reveals', type=int, nargs='+', default=[1],
+                        help='cues the observer sees per round (0 = all)')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write full results (with ratio histograms) as JSON')
+    args = parser.parse_args()
+
+    settings = [
+        dict(n_rounds=r, n_quadrants=q, n_queues=k, p_biased=p, biased_min=m,
+             unbiased_range=tuple(args.unbiased_range), reveals_per_round=v or None)
+        for r, q, k, p, m, v in itertools.product(args.rounds, args.quadrants, args.queues,
+                                                  args.p_biased, args.biased_min, args.reveals)
+    ]
+    results = run_grid(settings, args.games, args.workers, args.seed)
+
+    header = f"{'rounds':>6} {'quads':>5} {'queues':>6} {'p_bias':>6} {'min':>5} {'reveal':>6} {'reject':>8} {'observer':>8} {'r_bias':>6} {'r_other':>7}"
+    print(header)
+    for r in results:
+        print(f"{r['n_rounds']:>6} {r['n_quadrants']:>5} {r['n_queues']:>6} {r['p_biased']:>6.2f} "
+              f"{r['biased_min']:>5.2f} {r['reveals_per_round'] or 'all':>6} {r['rejection_rate']:>8.4f} {r['observer_accuracy']:>8.4f} "
+              f"{r['biased_ratio_mean']:>6.3f} {r['unbiased_ratio_mean']:>7.3f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,49 @@
+import os
+import threading
+import weakref
+
+
+def after_fork_in_child(obj, callback):
+    """Call callback(obj) in every forked child process, for as long as obj is alive"""
+    ref = weakref.ref(obj)
+
+    def forked():
+        target = ref()
+        if target is not None:
+            callback(target)
+    os.register_at_fork(after_in_child=forked)
+
+
+class PerProcess:
+    """Runs a setup callable once in each process, the first time ensure() is called.
+
+    Objects built at import time live in the gunicorn master and are copied
+    into every forked worker, where their threads are gone and inherited
+    descriptors, mmaps and locks would be shared with the master. Such state
+    is therefore set up lazily through ensure(), which repeats the setup in
+    each new process; a child also gets a fresh lock, in case the fork
+    happened while another thread held it.
+    """
+
+    def __init__(self, setup):
+        self.setup = setup
+        self.pid = None
+        self._lock = threading.Lock()
+        after_fork_in_child(self, PerProcess._forked)
+
+    def _forked(self):
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        """Whether the setup has run in this process"""
+        return self.pid == os.getpid()
+
+    def ensure(self):
+        if self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.setup()
+            self.pid = os.getpid()
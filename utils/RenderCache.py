@@ -0,0 +1,75 @@
+import re
+import threading
+from flask import current_app, make_response, render_template, request
+from markupsafe import escape
+from .config import RENDER_CACHE
+from .Metrics import metrics
+
+_SLOT = '\x1e{}\x1e'
+_SLOT_RE = re.compile('\x1e([^\x1e]*)\x1e')
+
+
+def slot(name):
+    """Placeholder rendered into a skeleton in place of a per-request value"""
+    return _SLOT.format(name)
+
+
+class RenderCache:
+    """Pre-rendered pages for the few distinct layouts the app serves.
+
+    page() keeps whole pages whose context has a small, fixed set of values
+    (index, final, the single-page runner). skeleton() renders a template
+    once per layout with slot() placeholders and keeps it split into literal
+    chunks, so fill() only joins escaped per-game values into it. Both are
+    bypassed in debug mode so template edits show up immediately.
+    """
+
+    def __init__(self, enabled=RENDER_CACHE):
+        self.enabled = enabled
+        self._pages = {}
+        self._skeletons = {}
+        self._lock = threading.Lock()
+
+    def _active(self):
+        return self.enabled and not current_app.debug
+
+    def page(self, template, **context):
+        if not self._active():
+            return render_template(template, **context)
+        # url_for output depends on where the app is mounted
+        key = (template, request.script_root, tuple(sorted(context.items())))
+        html = self._pages.get(key)
+        if html is None:
+            with metrics.span('render_page'):
+                html = render_template(template, **context)
+            with self._lock:
+                self._pages[key] = html
+        return html
+
+    def skeleton(self, template, layout, build_context):
+        """Literal chunks and slot names of template rendered with build_context(slot)"""
+        key = (template, request.script_root, layout)
+        parts = self._skeletons.get(key)
+        if parts is None:
+            with metrics.span('render_skeleton'):
+                parts = _SLOT_RE.split(render_template(template, **build_context(slot)))
+            with self._lock:
+                self._skeletons[key] = parts
+        return parts
+
+    def fill(self, template, layout, build_context, values):
+        """Render template for one request: build_context(slot) describes the layout, values fills the slots"""
+        if not self._active():
+            return render_template(template, **build_context(lambda name: values[name]))
+        parts = self.skeleton(template, layout, build_context)
+        # Odd positions are slot names; escape like Jinja's autoescape would
+        return ''.join(part if i % 2 == 0 else str(escape(values[part])) for i, part in enumerate(parts))
+
+
+def cached_response(html):
+    """HTML response with an ETag, answered with 304 when the client already has it"""
+    response = make_response(html)
+    # Pages depend on the participant's game, so browsers revalidate instead of sharing them
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
@@ -0,0 +1,32 @@
+import sqlite3
+import threading
+from .PerProcess import after_fork_in_child
+
+
+class SQLiteConnections:
+    """Connections to one SQLite database in WAL mode, one per thread and process.
+
+    Shared by the session store and the SQLite log storage: connections must
+    not cross a fork or be shared between threads, so get() opens one per
+    thread, and a forked child drops the ones it inherited.
+    """
+
+    def __init__(self, db_path, busy_timeout=10.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        after_fork_in_child(self, SQLiteConnections._forked)
+
+    def _forked(self):
+        # Kept referenced, never closed: closing would run SQLite's cleanup on the parent's database
+        self._inherited = self._local
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
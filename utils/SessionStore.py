@@ -0,0 +1,224 @@
+import os
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+from .config import SESSION_DB, SESSION_MEMORY_MAX_ENTRIES, SESSION_SWEEP_INTERVAL
+from .AppLog import get_logger
+from .Metrics import metrics
+from .SQLiteConnections import SQLiteConnections
+from .PerProcess import PerProcess
+
+logger = get_logger('SessionStore')
+
+
+class MemoryStore:
+    """In-process LRU cache with per-entry expiry; only valid for a single worker"""
+
+    def __init__(self, max_entries=SESSION_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._data.get(sid)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires <= time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return data
+
+    def set(self, sid, data, expires):
+        with self._lock:
+            self._data[sid] = (data, expires)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._data.items() if expires <= now]
+            for sid in expired:
+                del self._data[sid]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._data)
+
+    def size(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Session rows in a shared SQLite database (WAL), usable from several worker processes.
+
+    The number of rows is kept in a shared counter (counted once on startup,
+    then adjusted on every insert, delete and sweep), so size() needs no table scan.
+    """
+    SIZE_KEY = 'trt_session_store_entries'
+
+    def __init__(self, db_path=SESSION_DB, busy_timeout=10.0, counters=None):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.counters = counters or metrics.counters
+        self._connections = SQLiteConnections(db_path, busy_timeout)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid     TEXT PRIMARY KEY,
+                    data    TEXT NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires);
+            """)
+        self.counters.set(self.SIZE_KEY, len(self))
+
+    def _connect(self):
+        return self._connections.get()
+
+    def get(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE sid = ? AND expires > ?', (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data, expires):
+        with self._connect() as conn:
+            updated = conn.execute('UPDATE sessions SET data = ?, expires = ? WHERE sid = ?',
+                                   (data, expires, sid)).rowcount
+            if not updated:
+                conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)',
+                             (sid, data, expires))
+        if not updated:
+            self.counters.add(self.SIZE_KEY, 1.0)
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            removed = conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,)).rowcount
+        if removed:
+            self.counters.add(self.SIZE_KEY, -removed)
+
+    def sweep(self):
+        with self._connect() as conn:
+            removed = conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),)).rowcount
+        if removed:
+            self.counters.add(self.SIZE_KEY, -removed)
+        return removed
+
+    def size(self):
+        return int(self.counters.get(self.SIZE_KEY))
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+
+class StoreSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class StoreSessionInterface(SessionInterface):
+    """Server-side sessions kept in a MemoryStore or SQLiteStore.
+
+    The cookie only carries a signed random session id; the data is stored as
+    compact tagged JSON and expires PERMANENT_SESSION_LIFETIME after its last
+    save. A background thread sweeps expired entries every sweep_interval seconds.
+    """
+    serializer = TaggedJSONSerializer()
+    session_class = StoreSession
+
+    def __init__(self, store, sweep_interval=SESSION_SWEEP_INTERVAL):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self._sweeper = PerProcess(self._start_sweeper)
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='trt-session')
+
+    def _start_sweeper(self):
+        threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                removed = self.store.sweep()
+                if removed:
+                    logger.debug("Session sweeper removed %d expired sessions", removed)
+            except Exception as e:
+                logger.exception("Session sweep failed: %s", e)
+
+    def load(self, app, cookie):
+        """(sid, session data) for a session cookie value, or None if it is invalid or expired"""
+        if not cookie:
+            return None
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return None
+        data = self.store.get(sid)
+        if data is None:
+            return None
+        return sid, self.serializer.loads(data)
+
+    def open_session(self, app, request):
+        self._sweeper.ensure()
+        loaded = self.load(app, request.cookies.get(self.get_cookie_name(app)))
+        if loaded is not None:
+            sid, data = loaded
+            return self.session_class(data, sid=sid)
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        expires = time.time() + app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), expires)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def make_session_interface(backend):
+    if backend == 'memory':
+        return StoreSessionInterface(MemoryStore())
+    if backend == 'sqlite':
+        return StoreSessionInterface(SQLiteStore())
+    raise ValueError(f"Unknown session backend: {backend}")
\ No newline at end of file
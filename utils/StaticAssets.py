@@ -0,0 +1,128 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+from .config import STATIC_MAX_AGE, STATIC_PRECOMPRESS
+from .AppLog import get_logger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = get_logger('StaticAssets')
+
+
+def _compressors():
+    if brotli is not None:
+        yield 'br', '.br', lambda data: brotli.compress(data, quality=11)
+    yield 'gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(static_folder, extensions=STATIC_PRECOMPRESS):
+    """Write .br (when brotli is installed) and .gz copies next to each asset; returns how many were (re)built"""
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(extensions):
+                continue
+            path = os.path.join(root, name)
+            data = None
+            for _, suffix, compress in _compressors():
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                # Workers may start together; each replaces the file atomically
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(compress(data))
+                os.replace(tmp_path, target)
+                written += 1
+    return written
+
+
+class StaticAssets:
+    """Serves the static folder with content-versioned URLs and precompressed variants.
+
+    url_for('static', ...) gains a ?v=<content hash> argument, so versioned
+    requests can be cached for max_age and marked immutable; a changed file
+    gets a new URL. The .br or .gz copy is sent to clients that accept it.
+    """
+
+    def __init__(self, app, max_age=STATIC_MAX_AGE):
+        self.app = app
+        self.max_age = max_age
+        self._versions = {}
+        try:
+            built = precompress(app.static_folder)
+            if built:
+                logger.info("Precompressed %d static assets", built)
+        except OSError as e:
+            logger.warning("Could not precompress static assets: %s", e)
+        app.view_functions['static'] = self.serve
+        app.url_defaults(self.add_version)
+
+    def version(self, filename):
+        path = safe_join(self.app.static_folder, filename)
+        try:
+            mtime = os.path.getmtime(path)
+        except (OSError, TypeError):
+            return None
+        cached = self._versions.get(filename)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'rb') as f:
+                cached = (mtime, hashlib.md5(f.read()).hexdigest()[:12])
+            self._versions[filename] = cached
+        return cached[1]
+
+    def warm(self):
+        """Hash every asset up front, so no request pays for it; returns how many were hashed"""
+        suffixes = tuple(suffix for _, suffix, _ in _compressors())
+        hashed = 0
+        for root, _, files in os.walk(self.app.static_folder):
+            for name in files:
+                if not name.endswith(suffixes):
+                    rel = os.path.relpath(os.path.join(root, name), self.app.static_folder)
+                    hashed += self.version(rel.replace(os.sep, '/')) is not None
+        return hashed
+
+    def add_version(self, endpoint, values):
+        if endpoint == 'static' and 'v' not in values and 'filename' in values:
+            version = self.version(values['filename'])
+            if version:
+                values['v'] = version
+
+    def _variant(self, filename):
+        """(Content-Encoding, file to send) for the smallest up-to-date variant the client accepts"""
+        path = safe_join(self.app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None, filename
+        for encoding, suffix, _ in _compressors():
+            if request.accept_encodings[encoding] <= 0:
+                continue
+            try:
+                if os.path.getmtime(path + suffix) >= os.path.getmtime(path):
+                    return encoding, filename + suffix
+            except OSError:
+                continue
+        return None, filename
+
+    def serve(self, filename):
+        encoding, served = self._variant(filename)
+        versioned = request.args.get('v') == self.version(filename)
+        response = send_from_directory(
+            self.app.static_folder, served,
+            mimetype=mimetypes.guess_type(filename)[0],
+            max_age=self.max_age if versioned else None,
+        )
+        if versioned:
+            response.cache_control.immutable = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,171 @@
+"""Running study totals for the admin dashboard.
+
+GameLogger adds every game it creates and every choice it accepts into a
+SharedCounters file, so all workers update the same numbers and the
+dashboard reads a fixed-size snapshot however many games exist. The file
+persists across restarts; when it is missing (or reset) it is seeded once
+from the stored game logs.
+
+    python -m utils.StudyStats --rebuild
+"""
+import os
+import fcntl
+import argparse
+from datetime import datetime, timezone
+from .config import STUDY_STATS_FILE, STUDY_STATS_SLOTS, STUDY_MAX_ROUNDS
+from .Metrics import SharedCounters, series
+from .AppLog import get_logger
+
+logger = get_logger('StudyStats')
+
+# Choice send latency buckets in seconds: from the client's per-request sent_at to the server's timestamp
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _parse_time(value):
+    """ISO timestamp as an aware UTC datetime; naive values are server UTC times"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class StudyStats:
+    SEEDED = 'seeded'
+    # Stored in SEEDED; bump when the counter layout changes so old files are rebuilt
+    VERSION = 3
+
+    def __init__(self, counters=None, buckets=LATENCY_BUCKETS):
+        self.counters = counters or SharedCounters(STUDY_STATS_FILE, STUDY_STATS_SLOTS)
+        self.buckets = buckets
+
+    def _game_increments(self, metadata):
+        increments = [('games_started', 1.0)]
+        if metadata.get('biased_quadrant') is not None:
+            increments.append((series('biased_quadrant', {'quadrant': metadata['biased_quadrant']}), 1.0))
+        return increments
+
+    def _choice_increments(self, choices):
+        increments = []
+        finished = False
+        for choice in choices:
+            if choice.get('type') == 'final_choice':
+                # /final logs a game's answer once; a repeat in one log or batch is not another completion
+                if finished:
+                    continue
+                finished = True
+                increments.append(('games_completed', 1.0))
+                if choice.get('correct'):
+                    increments.append(('final_correct', 1.0))
+                continue
+            round_num = choice.get('round')
+            # Rounds come from the client, so keep the number of series bounded
+            if not isinstance(round_num, int) or not 0 <= round_num < STUDY_MAX_ROUNDS:
+                round_num = 'other'
+            increments.append((series('round_choices', {'round': round_num}), 1.0))
+            latency = self._latency(choice)
+            if latency is not None:
+                increments += [(series('latency_bucket', {'le': str(b)}), 1.0) for b in self.buckets if latency <= b]
+                increments += [('latency_count', 1.0), ('latency_sum', latency)]
+        return increments
+
+    @staticmethod
+    def _latency(choice):
+        # Not client_timestamp: batched choices are held by the client, and are all stamped on arrival
+        try:
+            return (_parse_time(choice['timestamp']) - _parse_time(choice['sent_at'])).total_seconds()
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+
+    def _add(self, increments):
+        # Statistics must never get in the way of logging
+        try:
+            self.counters.add_many(increments)
+        except Exception as e:
+            logger.warning("Could not update study stats: %s", e)
+
+    def game_started(self, metadata):
+        self._add(self._game_increments(metadata or {}))
+
+    def choices_logged(self, choices):
+        self._add(self._choice_increments(choices))
+
+    def seed(self, storage, force=False):
+        """Fill the counters from every stored game, once per VERSION; returns how many games were read"""
+        os.makedirs(os.path.dirname(self.counters.path), exist_ok=True)
+        with open(self.counters.path + '.seed.lock', 'a') as lock:
+            # Workers starting together: the first seeds, the others find it done
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not force and self.counters.get(self.SEEDED) == self.VERSION:
+                    return 0
+                totals = {}
+                n_games = 0
+                for game in storage.iter_games():
+                    for key, amount in (self._game_increments(game.get('metadata', {})) +
+                                        self._choice_increments(game.get('choices', []))):
+                        totals[key] = totals.get(key, 0.0) + amount
+                    n_games += 1
+                self.counters.clear()
+                self.counters.add_many(list(totals.items()) + [(self.SEEDED, float(self.VERSION))])
+                logger.info("Seeded study stats from %d stored games", n_games)
+                return n_games
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _median_latency(self, snapshot):
+        count = snapshot.get('latency_count', 0.0)
+        if not count:
+            return None
+        # Linear interpolation inside the bucket holding the middle observation
+        lower, below = 0.0, 0.0
+        for bound in self.buckets:
+            cumulative = snapshot.get(series('latency_bucket', {'le': str(bound)}), 0.0)
+            if cumulative >= count / 2:
+                in_bucket = cumulative - below
+                return lower + (bound - lower) * ((count / 2 - below) / in_bucket if in_bucket else 1.0)
+            lower, below = bound, cumulative
+        return self.buckets[-1]
+
+    def summary(self):
+        snapshot = self.counters.snapshot()
+        started = int(snapshot.get('games_started', 0))
+        completed = int(snapshot.get('games_completed', 0))
+        correct = int(snapshot.get('final_correct', 0))
+        quadrants, rounds = {}, {}
+        for key, value in snapshot.items():
+            if key.startswith('biased_quadrant{'):
+                quadrants[key.split('"')[1]] = int(value)
+            elif key.startswith('round_choices{'):
+                label = key.split('"')[1]
+                rounds[int(label) if label.isdigit() else label] = int(value)
+        # String keys, as in JSON, in round order
+        per_round = {str(r): rounds[r] for r in sorted(r for r in rounds if r != 'other')}
+        if 'other' in rounds:
+            per_round['other'] = rounds['other']
+        median = self._median_latency(snapshot)
+        count = snapshot.get('latency_count', 0.0)
+        return {
+            'games_started': started,
+            'games_completed': completed,
+            'completion_rate': completed / started if started else None,
+            'final_correct': correct,
+            'accuracy': correct / completed if completed else None,
+            'biased_quadrants': dict(sorted(quadrants.items())),
+            'choices_per_round': per_round,
+            'latency_samples': int(count),
+            'median_latency_ms': median * 1000 if median is not None else None,
+            'mean_latency_ms': snapshot.get('latency_sum', 0.0) / count * 1000 if count else None,
+        }
+
+
+study_stats = StudyStats()
+
+
+if __name__ == '__main__':
+    from .LogStorage import make_storage
+    parser = argparse.ArgumentParser(description='Show or rebuild the study dashboard totals')
+    parser.add_argument('--rebuild', action='store_true', help='recount everything from the stored game logs')
+    args = parser.parse_args()
+    if args.rebuild:
+        print(f"Read {study_stats.seed(make_storage(), force=True)} games", flush=True)
+    for name, value in study_stats.summary().items():
+        print(f"{name}: {value}")
@@ -0,0 +1,100 @@
+import random
+import threading
+from collections import deque
+from .config import TASK_POOL_CONFIGS, TASK_POOL_SIZE, TASK_POOL_LOW_WATER
+from .VSTtask import VSTtask
+from .AppLog import get_logger
+from .Metrics import metrics
+from .PerProcess import PerProcess
+
+logger = get_logger('TaskPool')
+
+
+class TaskPool:
+    """Pre-generated VSTtasks for each configured (n_rounds, n_quadrants, n_queues).
+
+    Tasks are kept per biased quadrant; get() hands out the quadrant that has
+    been assigned least often so far, which keeps the biased quadrant balanced
+    across participants served by this worker. A background thread tops each
+    queue back up to `size` once it drops below `low_water`.
+    """
+
+    def __init__(self, configs=TASK_POOL_CONFIGS, size=TASK_POOL_SIZE, low_water=TASK_POOL_LOW_WATER):
+        self.configs = [self._key(**c) for c in configs]
+        self.size = size
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._rng = random.Random()
+        # Tasks inherited over a fork would hand out the same seeds twice
+        self._process = PerProcess(self._start)
+        self._pools = {}
+        self._issued = {}
+
+    @staticmethod
+    def _key(n_rounds, n_quadrants, n_queues):
+        return (n_rounds, n_quadrants, n_queues)
+
+    def _start(self):
+        with self._lock:
+            self._pools = {key: [deque() for _ in range(key[1])] for key in self.configs}
+            self._issued = {key: [0] * key[1] for key in self.configs}
+        self._wake.set()
+        threading.Thread(target=self._refill_forever, name='task-pool', daemon=True).start()
+
+    def get(self, n_rounds, n_quadrants, n_queues):
+        """Pop a ready task, generating one inline on a miss"""
+        self._process.ensure()
+        key = self._key(n_rounds, n_quadrants, n_queues)
+        with self._lock:
+            issued = self._issued.setdefault(key, [0] * n_quadrants)
+            quadrant = min(range(n_quadrants), key=lambda q: (issued[q], self._rng.random()))
+            issued[quadrant] += 1
+            ready = self._pools.get(key)
+            task = ready[quadrant].popleft() if ready and ready[quadrant] else None
+            if task is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if ready and len(ready[quadrant]) < self.low_water:
+                self._wake.set()
+        return task or self._generate(key, quadrant)
+
+    @staticmethod
+    @metrics.timed('task_generate')
+    def _generate(key, quadrant):
+        # The seed decides the biased quadrant, so draw seeds until one lands on it
+        while True:
+            task = VSTtask(*key)
+            if task.biased_quadrant == quadrant:
+                return task
+
+    def fill(self):
+        """Top every queue up to the pool size"""
+        self._process.ensure()
+        for key, ready in self._pools.items():
+            for tasks in ready:
+                while len(tasks) < self.size:
+                    with metrics.span('task_pool_generate'):
+                        task = VSTtask(*key)
+                    if len(ready[task.biased_quadrant]) < self.size:
+                        ready[task.biased_quadrant].append(task)
+
+    def _refill_forever(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self.fill()
+            except Exception as e:
+                logger.exception("Task pool refill failed: %s", e)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'ready': {'x'.join(map(str, key)): [len(tasks) for tasks in ready]
+                      for key, ready in self._pools.items()},
+        }
\ No newline at end of file
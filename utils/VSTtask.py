@@ -1,8 +1,193 @@
+import math
 import random
-from .config import debug_log
+import argparse
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from functools import lru_cache
+from .config import TASK_CACHE_SIZE
+from .AppLog import get_logger
+from .Metrics import metrics
+
+logger = get_logger('VSTtask')
+
+
+@lru_cache(maxsize=None)
+def _accepted_red_counts(n_samples: int, p_red: float, low: float, high: float):
+    """Red counts k whose ratio k/n passes validation, with cumulative Binomial(n, p) weights"""
+    counts, cum_weights, total = [], [], 0.0
+    for k in range(n_samples + 1):
+        if low <= k / n_samples <= high:
+            total += math.comb(n_samples, k) * p_red ** k * (1 - p_red) ** (n_samples - k)
+            counts.append(k)
+            cum_weights.append(total)
+    return counts, cum_weights
+
+
+class QueueTable:
+    """Immutable cue name and quadrant of each queue, shared by every task of one shape.
+
+    Queues are numbered quadrant by quadrant: queue c is named chr(65 + c)
+    and belongs to quadrant c // n_queues.
+    """
+    __slots__ = ('n_quadrants', 'n_queues', 'names', 'quadrants')
+
+    def __init__(self, n_quadrants: int, n_queues: int):
+        self.n_quadrants = n_quadrants
+        self.n_queues = n_queues
+        self.names = tuple(chr(65 + c) for c in range(n_quadrants * n_queues))
+        self.quadrants = tuple(c // n_queues for c in range(n_quadrants * n_queues))
+
+    def __len__(self):
+        return len(self.names)
+
+
+@lru_cache(maxsize=None)
+def queue_table(n_quadrants: int, n_queues: int) -> QueueTable:
+    return QueueTable(n_quadrants, n_queues)
+
+
+class ColorMatrix:
+    """Colours of every queue in every round, one byte each (1 = RED, 0 = GREEN).
+
+    Bytes are grouped by quadrant, then round, then queue, so the
+    n_rounds * n_queues samples of a quadrant are contiguous and their reds
+    can be counted with a single bytes.count.
+    """
+    __slots__ = ('table', 'n_rounds', 'bits')
+    COLORS = ('GREEN', 'RED')
+
+    def __init__(self, table: QueueTable, n_rounds: int, bits: bytes):
+        self.table = table
+        self.n_rounds = n_rounds
+        self.bits = bits
+
+    @property
+    def samples_per_quadrant(self):
+        return self.n_rounds * self.table.n_queues
+
+    def color(self, round_num: int, queue: int) -> str:
+        quadrant, j = divmod(queue, self.table.n_queues)
+        return self.COLORS[self.bits[quadrant * self.samples_per_quadrant + round_num * self.table.n_queues + j]]
+
+    def red_counts(self):
+        """Reds per quadrant"""
+        n = self.samples_per_quadrant
+        return [self.bits.count(1, q * n, (q + 1) * n) for q in range(self.table.n_quadrants)]
+
+
+class CueView(Mapping):
+    """Read-only {'name', 'color', 'quadrant'} of one queue in one round"""
+    __slots__ = ('matrix', 'round_num', 'queue')
+    KEYS = ('name', 'color', 'quadrant')
+
+    def __init__(self, matrix: ColorMatrix, round_num: int, queue: int):
+        self.matrix = matrix
+        self.round_num = round_num
+        self.queue = queue
+
+    def __getitem__(self, key):
+        if key == 'name':
+            return self.matrix.table.names[self.queue]
+        if key == 'color':
+            return self.matrix.color(self.round_num, self.queue)
+        if key == 'quadrant':
+            return self.matrix.table.quadrants[self.queue]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class QueuesView(Sequence):
+    """The cues of one round, in queue order"""
+    __slots__ = ('matrix', 'round_num')
+
+    def __init__(self, matrix: ColorMatrix, round_num: int):
+        self.matrix = matrix
+        self.round_num = round_num
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if not -n <= index < n:
+            raise IndexError('queue index out of range')
+        return CueView(self.matrix, self.round_num, index % n)
+
+    def __len__(self):
+        return len(self.matrix.table)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class RoundView(Mapping):
+    """Lazy {'queues': [cue, ...]} of one round, as templates and get_round_data expect"""
+    __slots__ = ('matrix', 'round_num')
+
+    def __init__(self, matrix: ColorMatrix, round_num: int):
+        self.matrix = matrix
+        self.round_num = round_num
+
+    def __getitem__(self, key):
+        if key != 'queues':
+            raise KeyError(key)
+        return QueuesView(self.matrix, self.round_num)
+
+    def __iter__(self):
+        return iter(('queues',))
+
+    def __len__(self):
+        return 1
+
+    def to_dict(self) -> dict:
+        """Plain nested dicts, e.g. for JSON"""
+        return {'queues': [dict(cue) for cue in self['queues']]}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class RoundsView(Sequence):
+    __slots__ = ('matrix',)
+
+    def __init__(self, matrix: ColorMatrix):
+        self.matrix = matrix
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        n = len(self)
+        if not -n <= index < n:
+            raise IndexError('round index out of range')
+        return RoundView(self.matrix, index % n)
+
+    def __len__(self):
+        return self.matrix.n_rounds
+
 
 class VSTtask:
-    def __init__(self, n_rounds: int = 5, n_quadrants: int = 4, n_queues: int = 1):
+    """One game: the biased quadrant and a ColorMatrix, exposed through lazy round views"""
+    __slots__ = ('n_rounds', 'n_quadrants', 'n_queues', 'seed', 'table', 'biased_quadrant', 'colors')
+
+    # Colour model and the per-quadrant red ratios a game must satisfy
+    BIASED_RED_P = 0.9
+    UNBIASED_RED_P = 0.5
+    BIASED_MIN_RATIO = 0.8
+    UNBIASED_RATIO_RANGE = (0.35, 0.65)
+
+    def __init__(self, n_rounds: int = 5, n_quadrants: int = 4, n_queues: int = 1, seed: int = None):
         if not 2 <= n_quadrants <= 4:
             raise ValueError("Number of quadrants must be between 2 and 4")
         if n_queues < 1:
@@ -12,58 +197,92 @@ class VSTtask:
         self.n_quadrants = n_quadrants
         self.n_queues = n_queues
         
+        # Own generator: the same seed always yields the same biased quadrant and rounds.
+        # It is only needed while generating, so the task does not keep it.
+        self.seed = random.getrandbits(63) if seed is None else seed
+        rng = random.Random(self.seed)
+        
         # Setup quadrants and queues
-        self.letters = [chr(65 + i) for i in range(n_quadrants * n_queues)]
-        self.queue_map = {
-            q: self.letters[q*n_queues:(q+1)*n_queues]
-            for q in range(n_quadrants)
-        }
+        self.table = queue_table(n_quadrants, n_queues)
         
-        self.quadrants = list(range(n_quadrants))
-        self.biased_quadrant = random.choice(self.quadrants)
-        debug_log(f"Created VSTtask with biased quadrant: {self.biased_quadrant}")
-        self.rounds = self._generate_rounds()
+        self.biased_quadrant = rng.choice(self.quadrants)
+        logger.debug("Created VSTtask with seed %d, biased quadrant: %d", self.seed, self.biased_quadrant)
+        self.colors = self._generate_rounds(rng)
+
+    @property
+    def quadrants(self):
+        return range(self.n_quadrants)
+
+    @property
+    def rounds(self):
+        return RoundsView(self.colors)
 
-    def _get_color(self, quadrant: int) -> str:
+    def _is_red(self, quadrant: int, rng: random.Random) -> int:
+        p_red = self.BIASED_RED_P if quadrant == self.biased_quadrant else self.UNBIASED_RED_P
+        return 1 if rng.random() < p_red else 0
+
+    def _ratio_window(self, quadrant: int):
         if quadrant == self.biased_quadrant:
-            return 'RED' if random.random() < 0.9 else 'GREEN'
-        return random.choice(['RED', 'GREEN'])
+            return self.BIASED_RED_P, self.BIASED_MIN_RATIO, 1.0
+        return (self.UNBIASED_RED_P,) + self.UNBIASED_RATIO_RANGE
+
+    def _generate_rounds(self, rng: random.Random) -> ColorMatrix:
+        """Build the colour matrix in one pass.
 
-    def _generate_rounds(self):
+        Quadrants are validated independently, so the rejection sampler's
+        output is: per quadrant, a red count drawn from Binomial(n, p)
+        restricted to the accepted ratios, with the reds placed uniformly
+        over the quadrant's n = n_rounds * n_queues slots. Sample exactly that.
+        """
+        n_samples = self.n_rounds * self.n_queues
+        bits = bytearray(self.n_quadrants * n_samples)
+        for q in self.quadrants:
+            p_red, low, high = self._ratio_window(q)
+            counts, cum_weights = _accepted_red_counts(n_samples, p_red, low, high) if n_samples else ([], [])
+            if not counts:
+                raise ValueError(
+                    f"No colour assignment for {n_samples} samples in quadrant {q} "
+                    f"can satisfy red ratio {low}-{high}"
+                )
+            n_red = rng.choices(counts, cum_weights=cum_weights)[0]
+            for i in rng.sample(range(n_samples), n_red):
+                bits[q * n_samples + i] = 1
+        return ColorMatrix(self.table, self.n_rounds, bytes(bits))
+
+    def _generate_rounds_rejection(self):
+        """Reference sampler: draw every colour and retry until validation passes"""
+        # A stream of its own, independent of the one that chose the biased quadrant
+        rng = random.Random(f"{self.seed}-rejection")
+        n_samples = self.n_rounds * self.n_queues
         while True:
-            rounds = []
-            for _ in range(self.n_rounds):
-                round_queues = []
+            bits = bytearray(self.n_quadrants * n_samples)
+            for r in range(self.n_rounds):
                 for q in self.quadrants:
-                    for queue in self.queue_map[q]:
-                        round_queues.append({
-                            'name': queue,
-                            'color': self._get_color(q),
-                            'quadrant': q
-                        })
-                rounds.append({'queues': round_queues})
-            if self._validate_rounds([r['queues'] for r in rounds]):
-                return rounds
-
-    def _validate_rounds(self, rounds):
-        color_counts = {q: {'RED': 0, 'GREEN': 0} for q in self.quadrants}
-        for round_queues in rounds:
-            for queue in round_queues:
-                q = queue['quadrant']
-                color = queue['color']
-                color_counts[q][color] += 1
-        for q in self.quadrants:
-            total = color_counts[q]['RED'] + color_counts[q]['GREEN']
-            if total == 0:
-                return False
-            red_ratio = color_counts[q]['RED'] / total
-            if q == self.biased_quadrant:
-                if red_ratio < 0.8:
-                    return False
-            elif not (0.35 <= red_ratio <= 0.65):
+                    for j in range(self.n_queues):
+                        bits[q * n_samples + r * self.n_queues + j] = self._is_red(q, rng)
+            matrix = ColorMatrix(self.table, self.n_rounds, bytes(bits))
+            if self._validate_rounds(matrix):
+                return RoundsView(matrix)
+
+    def _validate_rounds(self, matrix: ColorMatrix) -> bool:
+        n_samples = matrix.samples_per_quadrant
+        if n_samples == 0:
+            return False
+        for q, n_red in enumerate(matrix.red_counts()):
+            _, low, high = self._ratio_window(q)
+            if not (low <= n_red / n_samples <= high):
                 return False
         return True
     
+    def get_params(self) -> dict:
+        """Everything needed to rebuild this task with load_task"""
+        return {
+            'seed': self.seed,
+            'n_rounds': self.n_rounds,
+            'n_quadrants': self.n_quadrants,
+            'n_queues': self.n_queues
+        }
+    
     def get_round_data(self, round_num: int):
         return self.rounds[round_num]
     
@@ -77,4 +296,55 @@ class VSTtask:
             "Active queues disappear after a short duration.<br><br>"
             f"After {self.n_rounds} rounds, identify the biased quadrant.<br>"
             "Correct: +100 points, Wrong: -100 points."
-        )
\ No newline at end of file
+        )
+
+
+@lru_cache(maxsize=TASK_CACHE_SIZE)
+@metrics.timed('task_load')
+def load_task(seed: int, n_rounds: int, n_quadrants: int, n_queues: int) -> VSTtask:
+    """Regenerate (or reuse) the task for a seed stored in a session"""
+    return VSTtask(n_rounds=n_rounds, n_quadrants=n_quadrants, n_queues=n_queues, seed=seed)
+
+
+def compare_generators(n_games: int = 20000, n_rounds: int = 5, n_quadrants: int = 4, n_queues: int = 1,
+                       seed: int = 0):
+    """Chi-square homogeneity test of the constructive sampler against the rejection sampler.
+
+    Each game is reduced to the red counts of the biased quadrant and of the
+    next quadrant, plus the colour of the biased quadrant's first slot.
+    Returns (chi2, degrees of freedom, approximate p-value).
+    """
+    rng = random.Random(seed)
+    samples = {'constructive': Counter(), 'rejection': Counter()}
+    for name, counter in samples.items():
+        for _ in range(n_games):
+            task = VSTtask(n_rounds, n_quadrants, n_queues, seed=rng.getrandbits(63))
+            rounds = task.rounds if name == 'constructive' else task._generate_rounds_rejection()
+            cues = [cue for r in rounds for cue in r['queues']]
+            other = (task.biased_quadrant + 1) % n_quadrants
+            counter[(
+                sum(c['color'] == 'RED' for c in cues if c['quadrant'] == task.biased_quadrant),
+                sum(c['color'] == 'RED' for c in cues if c['quadrant'] == other),
+                next(c['color'] for c in cues if c['quadrant'] == task.biased_quadrant),
+            )] += 1
+
+    a, b = samples['constructive'], samples['rejection']
+    categories = set(a) | set(b)
+    chi2 = sum((a[k] - b[k]) ** 2 / (a[k] + b[k]) for k in categories)
+    df = max(len(categories) - 1, 1)
+    # Wilson-Hilferty approximation of the chi-square tail
+    z = ((chi2 / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return chi2, df, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the constructive round generator against rejection sampling')
+    parser.add_argument('--games', type=int, default=20000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--quadrants', type=int, default=4)
+    parser.add_argument('--queues', type=int, default=1)
+    args = parser.parse_args()
+    chi2, df, p_value = compare_generators(args.games, args.rounds, args.quadrants, args.queues)
+    print(f"chi2={chi2:.2f} df={df} p={p_value:.4f}")
+    if p_value < 0.001:
+        raise SystemExit("Generators disagree")
\ No newline at end of file
@@ -2,21 +2,89 @@ import os
 
 # Set up base directory (using absolute path)
 BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))  # Go up one level from utils
-LOGS_DIR = os.path.join(BASE_DIR, 'logs')
-SESSION_DIR = os.path.join(BASE_DIR, 'flask_session')
-DEBUG_LOG = os.path.join(BASE_DIR, 'flask_debug.log')
-
-def debug_log(message):
-    """Write debug messages with timestamp"""
-    from datetime import datetime
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-    log_message = f"{timestamp} - {message}"
-    try:
-        with open(DEBUG_LOG, 'a') as f:
-            f.write(log_message + '\n')
-    except Exception as e:
-        print(f"Error writing to debug log: {e}")
+# TRT_* environment variables override data locations and backends (used by benchmark.py)
+LOGS_DIR = os.environ.get('TRT_LOGS_DIR', os.path.join(BASE_DIR, 'logs'))
+SESSION_DIR = os.environ.get('TRT_SESSION_DIR', os.path.join(BASE_DIR, 'flask_session'))
+DEBUG_LOG = os.environ.get('TRT_DEBUG_LOG', os.path.join(BASE_DIR, 'flask_debug.log'))
+
+# Server-side sessions: 'memory' (in-process LRU, single worker only), 'sqlite' (shared by all workers)
+# or 'filesystem' (Flask-Session files in SESSION_DIR)
+SESSION_BACKEND = os.environ.get('TRT_SESSION_BACKEND', 'sqlite')
+SESSION_DB = os.path.join(SESSION_DIR, 'sessions.sqlite3')
+SESSION_MEMORY_MAX_ENTRIES = 10000
+SESSION_SWEEP_INTERVAL = 60      # seconds between expired-session sweeps
+
+# Game log storage: 'sharded' (one file per game under GAME_LOGS_DIR/<day>/<game_id prefix>/, compacted
+# into GAME_LOGS_DIR/segments/), 'json' (one file per game directly in GAME_LOGS_DIR) or 'sqlite' (single WAL database)
+LOG_BACKEND = os.environ.get('TRT_LOG_BACKEND', 'sharded')
+GAME_LOGS_DIR = os.environ.get('TRT_GAME_LOGS_DIR', os.path.join(BASE_DIR, 'utils', 'logs'))
+SQLITE_LOG_DB = os.path.join(LOGS_DIR, 'games.sqlite3')
+COMPACT_AFTER_HOURS = 24         # completed games untouched this long are moved into compressed segments
+
+# Game log format for the 'json' backend ('sharded' always uses jsonl): 'jsonl' (append-only, one event per line) or 'json' (legacy single document)
+LOG_FORMAT = 'jsonl'
+
+# Choice logging: 'sync' writes inside the request, 'async' hands events to a background writer thread
+WRITER_MODE = os.environ.get('TRT_WRITER_MODE', 'async')
+WRITER_QUEUE_SIZE = 10000        # events buffered before new ones are dropped
+WRITER_BATCH_SIZE = 500          # max events drained per write batch
+WRITER_PUT_TIMEOUT = 0.05        # seconds a request waits on a full queue before dropping
+WRITER_FSYNC = 'interval'        # 'always' (every batch), 'interval', or 'shutdown'
+WRITER_FSYNC_INTERVAL_MS = 200
+
+# Stateless games: /start issues a signed cookie token with the game's (masked) seed, parameters and progress,
+# so round pages and choice logging need no session-store read and any worker can serve any request
+STATELESS_GAMES = os.environ.get('TRT_STATELESS_GAMES', '0') == '1'
+# Signs sessions and game tokens; required for stateless games, since a known key lets anyone forge tokens
+SECRET_KEY = os.environ.get('TRT_SECRET_KEY')
+
+# asgi_ingest.py: threads running the Flask routes, largest accepted request body, and the writer queue
+# fill ratio above which choice ingestion answers 503 + Retry-After instead of waiting for space
+ASGI_WSGI_THREADS = 32
+ASGI_MAX_BODY = 1024 * 1024
+ASGI_QUEUE_HIGH_WATER = 0.9
+
+# Token required by the admin routes (/export, /admin/dashboard, /diagnostics); they are disabled when unset
+ADMIN_TOKEN = os.environ.get('TRT_ADMIN_TOKEN')
+
+# Task shape for new games, and how many regenerated tasks each worker keeps around
+GAME_CONFIG = {'n_rounds': 5, 'n_quadrants': 4, 'n_queues': 1}
+TASK_CACHE_SIZE = 256
+
+# Serve all rounds from one page (/play) that fetches the game once and logs choices in batches
+SINGLE_PAGE_RUNNER = True
+MAX_LOG_BATCH = 1000             # choice events accepted per /log_choices request
+
+# Pages are rendered once per layout and reused (see utils/RenderCache.py); static assets get
+# content-versioned URLs cached for STATIC_MAX_AGE seconds, and gzip/brotli copies of STATIC_PRECOMPRESS files
+RENDER_CACHE = True
+STATIC_MAX_AGE = 365 * 24 * 3600
+STATIC_PRECOMPRESS = ('.css', '.js')
+
+# Pre-generated tasks per configuration and biased quadrant, refilled below the low-water mark
+TASK_POOL_CONFIGS = [GAME_CONFIG]
+TASK_POOL_SIZE = 32
+TASK_POOL_LOW_WATER = 8
+
+# Request/span metrics shared by all workers through an mmap'ed counter file (served at /metrics)
+METRICS_FILE = os.path.join(LOGS_DIR, 'metrics.mmap')
+METRICS_SLOTS = 4096
+
+# Study totals for the admin dashboard (utils/StudyStats.py), shared by all workers and kept across restarts
+STUDY_STATS_FILE = os.path.join(LOGS_DIR, 'study_stats.mmap')
+STUDY_STATS_SLOTS = 1024
+STUDY_MAX_ROUNDS = 256           # higher round numbers are counted together as 'other'
+
+# Health checks (utils/Diagnostics.py): seconds between writability/disk probes, and the free space
+# below which /healthz reports unhealthy
+HEALTH_PROBE_INTERVAL = 10
+HEALTH_MIN_FREE_MB = 200
+
+# Application logging (utils/AppLog.py): level and size-based rotation of DEBUG_LOG
+LOG_LEVEL = os.environ.get('TRT_LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
 
 # Create necessary directories
-for directory in [LOGS_DIR, SESSION_DIR]:
+for directory in [LOGS_DIR, SESSION_DIR, os.path.dirname(DEBUG_LOG)]:
     os.makedirs(directory, mode=0o775, exist_ok=True)
\ No newline at end of file